@@ -1,6 +1,8 @@
 from fastapi import FastAPI
+import os
 
 
-DATABASE = 'sqlite:///sqlite.db'
+DATABASE_PATH = os.environ.get('SQLITE_PATH', 'sqlite.db')
+DATABASE = 'sqlite:///' + DATABASE_PATH
 
 app = FastAPI(title="REST API using FastAPI sqlite Async endpoits")
@@ -0,0 +1,83 @@
+import asyncio
+import contextvars
+
+
+class WriteBatcher:
+    """Group commit for small, independent writes.
+
+    `submit` queues one write and waits for its result. Writes arriving
+    within `max_delay` of each other, up to `max_size`, run in one
+    transaction, so a burst costs one commit instead of one per request.
+    Each write gets its own savepoint: a failing write fails only its own
+    caller, and every caller gets back what its own write returned.
+    """
+
+    def __init__(self, database, write, max_size=100, max_delay=0.005):
+        self.database = database
+        self.write = write
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._pending = []
+        self._timer = None
+        self._flushing = set()
+        self.batches = 0
+        self.writes = 0
+
+    async def submit(self, values):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending.append((values, future))
+        if len(self._pending) >= self.max_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self.flush)
+        return await future
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        # Started from an empty context so the batch gets a databases
+        # connection of its own rather than the one of whichever request
+        # happened to submit first.
+        task = contextvars.Context().run(asyncio.ensure_future, self._commit(batch))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _commit(self, batch):
+        outcomes = []
+        try:
+            async with self.database.transaction():
+                for values, future in batch:
+                    try:
+                        async with self.database.transaction():
+                            outcomes.append((future, await self.write(values), None))
+                    except Exception as exc:
+                        outcomes.append((future, None, exc))
+        except Exception as exc:
+            outcomes = [(future, None, exc) for _, future in batch]
+        self.batches += 1
+        self.writes += len(batch)
+        for future, result, exc in outcomes:
+            # a caller that went away still had its write committed
+            if future.done():
+                continue
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+    async def close(self):
+        self.flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'writes': self.writes,
+            'pending': len(self._pending),
+        }
@@ -0,0 +1,63 @@
+"""Compare two benchmark reports endpoint by endpoint.
+
+    python -m benchmarks.compare baseline.json run.json --threshold 0.2
+
+Exits with status 1 when any endpoint's p95 grew by more than `--threshold`
+(a fraction) or it started returning errors, so it can gate a deploy.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as report:
+        return json.load(report)['endpoints']
+
+def change(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) / before
+
+
+def compare(baseline, current, threshold):
+    regressions = []
+    rows = []
+    for name in sorted(set(baseline) | set(current)):
+        before, after = baseline.get(name), current.get(name)
+        if before is None or after is None:
+            rows.append((name, 'only in {}'.format('current' if before is None else 'baseline')))
+            continue
+        p95 = change(before['p95_ms'], after['p95_ms'])
+        throughput = change(before['throughput'], after['throughput'])
+        regressed = (p95 is not None and p95 > threshold) or after['errors'] > before['errors']
+        if regressed:
+            regressions.append(name)
+        rows.append((name, 'p50 {} -> {} ms, p95 {} -> {} ms ({}), p99 {} -> {} ms, {} -> {} req/s ({}){}'.format(
+            before['p50_ms'], after['p50_ms'], before['p95_ms'], after['p95_ms'], percent(p95),
+            before['p99_ms'], after['p99_ms'], before['throughput'], after['throughput'], percent(throughput),
+            '  REGRESSION' if regressed else '',
+        )))
+    return rows, regressions
+
+def percent(value):
+    return 'n/a' if value is None else '{:+.1%}'.format(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed p95 growth, 0.2 is 20%%')
+    args = parser.parse_args()
+
+    rows, regressions = compare(load(args.baseline), load(args.current), args.threshold)
+    for name, line in rows:
+        print('{:<22} {}'.format(name, line))
+    if regressions:
+        print('\n{} regressed: {}'.format(len(regressions), ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+"""Drive the ASGI app in-process and report latency per endpoint as JSON.
+
+    python -m benchmarks.seed --path bench.db
+    python -m benchmarks.run --path bench.db --requests 500 --concurrency 32 --output run.json
+
+Each endpoint is run on its own, `--requests` times by `--concurrency`
+concurrent clients, in the order below: reads first, then writes, then the
+deletes. No sockets or server are involved, so the numbers are the app's own
+cost: routing, validation, serialization and the database.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from collections import namedtuple
+
+
+Endpoint = namedtuple('Endpoint', ['name', 'method', 'path', 'token', 'body'])
+
+
+class Client:
+    """Minimal in-process ASGI client: one HTTP request per call."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method, path, headers=None, body=b''):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': [(b'host', b'benchmark')] + [
+                (name.lower().encode(), value.encode()) for name, value in (headers or {}).items()
+            ],
+            'client': ('127.0.0.1', 50000),
+            'server': ('benchmark', 80),
+        }
+        request_sent = False
+        response_done = asyncio.Event()
+        status = None
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            await response_done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                response_done.set()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            response_done.set()
+        return status
+
+
+class Dataset:
+    """Ids to pick requests from, read from the seeded database."""
+
+    def __init__(self, path, rng):
+        self.rng = rng
+        connection = sqlite3.connect(path)
+        query = lambda sql: connection.execute(sql).fetchone()
+        self.max_user_id = query('SELECT MAX(id) FROM users')[0] or 1
+        self.max_job_id = query('SELECT MAX(id) FROM jobs')[0] or 1
+        self.admin_id = (query("SELECT id FROM users WHERE role = 'a' LIMIT 1") or [1])[0]
+        self.recruiter_id = (query(
+            "SELECT created_by FROM jobs WHERE status != 'd' GROUP BY created_by ORDER BY COUNT(*) DESC LIMIT 1"
+        ) or [1])[0]
+        self.recruiter_jobs = [row[0] for row in connection.execute(
+            "SELECT id FROM jobs WHERE created_by = ? AND status != 'd' LIMIT 1000", (self.recruiter_id,)
+        )] or [1]
+        self.user_id = (query(
+            'SELECT user_id FROM applied_jobs GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1'
+        ) or [1])[0]
+        self.apply_ids = [row[0] for row in connection.execute(
+            'SELECT id FROM applied_jobs WHERE user_id = ? LIMIT 1000', (self.user_id,)
+        )] or [1]
+        # the recruiter's posting with the most applicants
+        self.applicant_job = (query(
+            'SELECT job_id FROM applied_jobs WHERE job_id IN (SELECT id FROM jobs WHERE created_by = {}) '
+            'GROUP BY job_id ORDER BY COUNT(*) DESC LIMIT 1'.format(int(self.recruiter_id))
+        ) or [self.recruiter_jobs[0]])[0]
+        self.applicant_ids = [row[0] for row in connection.execute(
+            'SELECT id FROM applied_jobs WHERE job_id = ? LIMIT 1000', (self.applicant_job,)
+        )] or [1]
+        self.seekers = [row[0] for row in connection.execute(
+            "SELECT id FROM users WHERE role = 'u' ORDER BY random() LIMIT 1000"
+        )] or [1]
+        self.categories = [row[0] for row in connection.execute('SELECT name FROM job_categories')] or ['eng']
+        self.locations = [row[0] for row in connection.execute(
+            'SELECT DISTINCT location FROM jobs LIMIT 100'
+        ) if row[0]] or ['Chennai']
+        connection.close()
+        self.counter = 0
+
+    def unique(self, prefix):
+        self.counter += 1
+        return '{}-{}-{}'.format(prefix, os.getpid(), self.counter)
+
+    def job(self):
+        return {
+            'category': self.rng.choice(self.categories),
+            'company_name': 'Benchmark',
+            'job_title': 'Benchmark engineer',
+            'job_type': 'full time',
+            'experiance_min': 1,
+            'experiance_max': 3,
+            'job_count': 1,
+            'location': self.rng.choice(self.locations),
+            'description_short': 'Synthetic posting',
+            'description_long': 'Created by the benchmark run',
+        }
+
+    def user(self, username=None):
+        return {
+            'username': username or self.unique('bench'),
+            'password': 'benchmark',
+            'first_name': 'Bench',
+            'last_name': 'Mark',
+            'phone': '9000000000',
+            'gender': 'other',
+        }
+
+
+def endpoints(data, include_exports=False):
+    rng = data.rng
+    json_body = lambda build: lambda: json.dumps(build()).encode()
+    bulk = lambda: b'\n'.join(json.dumps(data.job()).encode() for _ in range(100))
+    seeker = lambda: rng.choice(data.seekers)
+    # users.delete removes accounts from the top id down, each with its own
+    # token; the worker asks for the token right before the path
+    doomed = [data.max_user_id + 1]
+
+    def next_doomed():
+        doomed[0] -= 1
+        return doomed[0]
+
+    reads = [
+        Endpoint('users.list', 'GET', lambda: '/users/?paginate=20&skip={}'.format(rng.randint(0, 1000)), None, None),
+        Endpoint('users.get', 'GET', lambda: '/users/{}'.format(rng.randint(1, data.max_user_id)), None, None),
+        Endpoint('jobs.list', 'GET', lambda: '/jobs/?paginate=20', None, None),
+        Endpoint('jobs.filter', 'GET', lambda: '/jobs/?category={}&location={}&experiance_min=2'.format(
+            rng.choice(data.categories), rng.choice(data.locations)), None, None),
+        Endpoint('jobs.get', 'GET', lambda: '/jobs/{}'.format(rng.randint(1, data.max_job_id)), None, None),
+        Endpoint('jobs.search', 'GET', lambda: '/jobs/search?q={}'.format(
+            rng.choice(['python', 'engineer', 'data', 'remote', 'cloud platform'])), None, None),
+        Endpoint('jobs.categories', 'GET', lambda: '/jobs/category', None, None),
+        Endpoint('jobs.cache_stats', 'GET', lambda: '/jobs/cache/stats', None, None),
+        Endpoint('jobs.posted', 'GET', lambda: '/jobs/my/posted', data.recruiter_id, None),
+        Endpoint('jobs.dashboard', 'GET', lambda: '/jobs/my/dashboard?paginate=20', data.recruiter_id, None),
+        Endpoint('applicants.list', 'GET', lambda: '/jobs/{}/applicants?paginate=20'.format(data.applicant_job),
+                 data.recruiter_id, None),
+        Endpoint('applications.list', 'GET', lambda: '/users/jobs/my?paginate=20', data.user_id, None),
+        Endpoint('applications.get', 'GET', lambda: '/users/jobs/my/{}'.format(rng.choice(data.apply_ids)),
+                 data.user_id, None),
+        Endpoint('applications.batch', 'GET', lambda: '/users/jobs/my/batch?' + '&'.join(
+            'apply_ids={}'.format(apply_id) for apply_id in rng.sample(data.apply_ids, min(20, len(data.apply_ids)))
+        ), data.user_id, None),
+        Endpoint('favourites.list', 'GET', lambda: '/users/favourites/all?include_jobs=true', data.user_id, None),
+        Endpoint('auth.refresh', 'POST', lambda: '/auth/refresh', data.user_id, None),
+        Endpoint('auth.login', 'POST', lambda: '/auth/login', None,
+                 json_body(lambda: {'username': 'user{}@example.com'.format(seeker()), 'password': 'benchmark'})),
+    ]
+    if include_exports:
+        reads += [
+            Endpoint('export.jobs', 'GET', lambda: '/export/jobs', data.admin_id, None),
+            Endpoint('export.applications', 'GET', lambda: '/export/applied_jobs?format=csv&gzip=true',
+                     data.admin_id, None),
+        ]
+    writes = [
+        Endpoint('users.create', 'POST', lambda: '/users/', None, json_body(data.user)),
+        Endpoint('users.update', 'PUT', lambda: '/users/{}'.format(data.user_id), data.user_id,
+                 json_body(lambda: data.user('user{}@example.com'.format(data.user_id)))),
+        Endpoint('categories.create', 'POST', lambda: '/jobs/category', data.recruiter_id,
+                 json_body(lambda: {'name': data.unique('category')})),
+        Endpoint('jobs.create', 'POST', lambda: '/jobs/', data.recruiter_id, json_body(data.job)),
+        Endpoint('jobs.bulk', 'POST', lambda: '/jobs/bulk', data.recruiter_id, bulk),
+        Endpoint('jobs.update', 'PUT', lambda: '/jobs/{}'.format(rng.choice(data.recruiter_jobs)),
+                 data.recruiter_id, json_body(data.job)),
+        Endpoint('applicants.status', 'PUT', lambda: '/jobs/{}/applicants/status'.format(data.applicant_job),
+                 data.recruiter_id, json_body(lambda: {
+                     'apply_ids': rng.sample(data.applicant_ids, min(100, len(data.applicant_ids))),
+                     'status': rng.choice(['selected', 'rejected']),
+                 })),
+        Endpoint('applications.create', 'POST', lambda: '/users/jobs/{}'.format(rng.randint(1, data.max_job_id)),
+                 seeker, json_body(lambda: {})),
+        Endpoint('favourites.add', 'POST', lambda: '/users/favourite/{}'.format(rng.randint(1, data.max_job_id)),
+                 data.user_id, None),
+        Endpoint('favourites.remove', 'DELETE', lambda: '/users/favourite/{}'.format(rng.randint(1, data.max_job_id)),
+                 data.user_id, None),
+        Endpoint('jobs.delete', 'DELETE', lambda: '/jobs/{}'.format(data.recruiter_jobs.pop()
+                 if len(data.recruiter_jobs) > 1 else data.recruiter_jobs[0]), data.recruiter_id, None),
+        Endpoint('users.delete', 'DELETE', lambda: '/users/{}'.format(doomed[0]), next_doomed, None),
+    ]
+    return reads + writes
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    # nearest rank
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+def summarize(latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+    ms = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for code, count in statuses.items() if code is None or code >= 500),
+        'statuses': {str(code): count for code, count in sorted(statuses.items(), key=lambda item: str(item[0]))},
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': ms(statistics.mean(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1]) if latencies else None,
+    }
+
+
+async def run_endpoint(client, endpoint, requests, concurrency, token_for):
+    latencies = []
+    statuses = {}
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            user_id = endpoint.token() if callable(endpoint.token) else endpoint.token
+            headers = {'token': token_for(user_id)} if user_id else {}
+            body = endpoint.body() if endpoint.body else b''
+            if body:
+                headers['content-type'] = 'application/json'
+            path = endpoint.path()
+            started = time.perf_counter()
+            try:
+                status = await client.request(endpoint.method, path, headers, body)
+            except Exception:
+                status = None
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return summarize(latencies, statuses, time.perf_counter() - started)
+
+
+async def benchmark(args):
+    # settings are read at import, so the database is chosen before main loads
+    os.environ['SQLITE_PATH'] = args.path
+    # one client hammering every route is what the rate limits are for
+    for name in ('RATE_LIMIT_AUTH', 'RATE_LIMIT_USERS', 'RATE_LIMIT_JOBS'):
+        os.environ.setdefault(name, '0/1')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from main import app
+    from helpers import genrate_token
+
+    rng = random.Random(args.seed)
+    data = Dataset(args.path, rng)
+    roles = {}
+    connection = sqlite3.connect(args.path)
+
+    def token_for(user_id):
+        if user_id not in roles:
+            row = connection.execute('SELECT role FROM users WHERE id = ?', (user_id,)).fetchone()
+            role = {'a': 'admin', 'r': 'recruiter'}.get(row[0] if row else 'u', 'user')
+            roles[user_id] = genrate_token({'user_id': user_id, 'role': role})
+        return roles[user_id]
+
+    selected = endpoints(data, args.exports)
+    if args.only:
+        selected = [endpoint for endpoint in selected if any(endpoint.name.startswith(name) for name in args.only)]
+
+    client = Client(app)
+    await app.router.startup()
+    results = {}
+    try:
+        for endpoint in selected:
+            if args.warmup:
+                await run_endpoint(client, endpoint, args.warmup, args.concurrency, token_for)
+            results[endpoint.name] = await run_endpoint(client, endpoint, args.requests, args.concurrency, token_for)
+            print('{:<22} {p50_ms:>9} {p95_ms:>9} {p99_ms:>9} ms  {throughput:>8} req/s  {errors} errors'.format(
+                endpoint.name, **results[endpoint.name]), file=sys.stderr, flush=True)
+    finally:
+        await app.router.shutdown()
+        connection.close()
+
+    return {
+        'meta': {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'database': os.path.abspath(args.path),
+            'users': data.max_user_id,
+            'jobs': data.max_job_id,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'seed': args.seed,
+        },
+        'endpoints': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--path', default='bench.db')
+    parser.add_argument('--requests', type=int, default=500, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--warmup', type=int, default=50, help='unmeasured requests per endpoint')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='*', help='endpoint name prefixes, e.g. jobs. users.get')
+    parser.add_argument('--exports', action='store_true', help='include the /export streams')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        parser.error('{} does not exist, create it with `python -m benchmarks.seed`'.format(args.path))
+    report = asyncio.run(benchmark(args))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""Fill a database with synthetic users, jobs, applications and favourites.
+
+    python -m benchmarks.seed --path bench.db --users 100000 --jobs 1000000 --applications 5000000
+
+The schema comes from migrations.py, rows are written with executemany on a
+stdlib sqlite3 connection. Every user's password is `benchmark`; user 1 is
+an admin and every twentieth user a recruiter.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import time
+
+import hashers
+import migrations
+from connections import configure
+
+
+PASSWORD = 'benchmark'
+RECRUITER_EVERY = 20
+CHUNK_SIZE = 10000
+
+TITLES = [
+    'Python developer', 'Go engineer', 'Data analyst', 'Frontend developer', 'Site reliability engineer',
+    'Product manager', 'QA engineer', 'Data scientist', 'Android developer', 'Technical writer',
+    'Backend engineer', 'DevOps engineer', 'UX designer', 'Security analyst', 'Database administrator',
+]
+COMPANIES = ['Acme', 'Globex', 'Initech', 'Umbrella', 'Hooli', 'Stark', 'Wayne', 'Wonka', 'Tyrell', 'Cyberdyne']
+LOCATIONS = [
+    'Chennai', 'Bangalore', 'Mumbai', 'Delhi', 'Hyderabad', 'Pune', 'Kolkata', 'Coimbatore', 'Kochi', 'Remote',
+]
+WORDS = [
+    'build', 'scale', 'maintain', 'design', 'services', 'platform', 'team', 'customers', 'data', 'pipelines',
+    'api', 'cloud', 'testing', 'mentoring', 'performance', 'reliable', 'fast', 'secure', 'python', 'sqlite',
+]
+JOB_TYPES = ['ft', 'pt', 'i']
+# mostly open postings, as in production
+JOB_STATUSES = ['cr'] * 16 + ['a', 's', 'f', 'cl', 'd']
+APPLICATION_STATUSES = ['a'] * 8 + ['s', 'r']
+GENDERS = ['m', 'f', 'o']
+
+
+def recruiter_ids(users):
+    return list(range(2, users + 1, RECRUITER_EVERY))
+
+def is_recruiter(user_id):
+    return user_id % RECRUITER_EVERY == 2
+
+def role(user_id):
+    if user_id == 1:
+        return 'a'
+    return 'r' if is_recruiter(user_id) else 'u'
+
+
+def insert(cursor, sql, rows):
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            cursor.executemany(sql, chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        cursor.executemany(sql, chunk)
+        count += len(chunk)
+    return count
+
+
+def users(count, password):
+    for user_id in range(1, count + 1):
+        yield (
+            user_id, 'user{}@example.com'.format(user_id), password, 'First{}'.format(user_id),
+            'Last{}'.format(user_id), '9{:09d}'.format(user_id), GENDERS[user_id % 3], role(user_id),
+        )
+
+def categories(count):
+    for category_id in range(1, count + 1):
+        yield category_id, 1, 'category-{}'.format(category_id)
+
+def jobs(rng, count, recruiters, category_count):
+    for job_id in range(1, count + 1):
+        experiance_min = rng.randint(0, 10)
+        description = ' '.join(rng.choice(WORDS) for _ in range(30))
+        yield (
+            job_id, 'category-{}'.format(rng.randint(1, category_count)), rng.choice(recruiters),
+            rng.choice(COMPANIES), rng.choice(TITLES), rng.choice(JOB_TYPES), experiance_min,
+            experiance_min + rng.randint(1, 5), rng.randint(1, 10), rng.choice(LOCATIONS),
+            rng.choice(JOB_STATUSES), description[:255], description * 4,
+        )
+
+def per_user(rng, user_count, total, job_count):
+    # (user_id, job_id) pairs, unique per user, spread over regular users
+    seekers = [user_id for user_id in range(1, user_count + 1) if role(user_id) == 'u']
+    if not seekers or not job_count:
+        return
+    remaining = total
+    for index, user_id in enumerate(seekers):
+        left = len(seekers) - index
+        count = min(remaining if left == 1 else rng.randint(0, 2 * remaining // left), job_count)
+        remaining -= count
+        for job_id in sorted(rng.sample(range(1, job_count + 1), count)):
+            yield user_id, job_id
+
+def applications(rng, user_count, total, job_count):
+    for user_id, job_id in per_user(rng, user_count, total, job_count):
+        yield user_id, job_id, rng.choice(APPLICATION_STATUSES)
+
+def favourites(rng, user_count, total, job_count):
+    for user_id, job_id in per_user(rng, user_count, total, job_count):
+        yield user_id, job_id, 1
+
+
+def seed(path, user_count, category_count, job_count, application_count, favourite_count, seed_value=0):
+    rng = random.Random(seed_value)
+    migrations.migrate(path)
+    connection = sqlite3.connect(path, isolation_level=None)
+    configure(connection)
+    # a throwaway database, durability is not worth the fsyncs
+    connection.execute('PRAGMA synchronous = OFF')
+    cursor = connection.cursor()
+    timings = {}
+
+    def step(name, sql, rows):
+        started = time.perf_counter()
+        cursor.execute('BEGIN')
+        count = insert(cursor, sql, rows)
+        cursor.execute('COMMIT')
+        timings[name] = {'rows': count, 'seconds': round(time.perf_counter() - started, 2)}
+        print('{:<14} {:>9} rows {:>8.2f}s'.format(name, count, timings[name]['seconds']), flush=True)
+
+    password = hashers.encode_password(PASSWORD)
+    step('users', 'INSERT INTO users (id, username, password, first_name, last_name, phone, gender, role) '
+         'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', users(user_count, password))
+    step('categories', 'INSERT INTO job_categories (id, added_by, name) VALUES (?, ?, ?)', categories(category_count))
+    step('jobs', 'INSERT INTO jobs (id, ' + ', '.join(migrations.JOB_COLUMNS) + ') '
+         'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+         jobs(rng, job_count, recruiter_ids(user_count), category_count))
+    step('applications', 'INSERT INTO applied_jobs (user_id, job_id, status) VALUES (?, ?, ?)',
+         applications(rng, user_count, application_count, job_count))
+    step('favourites', 'INSERT INTO favourite_jobs (user_id, job_id, is_liked) VALUES (?, ?, ?)',
+         favourites(rng, user_count, favourite_count, job_count))
+    connection.execute('ANALYZE')
+    connection.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--path', default='bench.db')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--jobs', type=int, default=1000000)
+    parser.add_argument('--applications', type=int, default=5000000)
+    parser.add_argument('--favourites', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--force', action='store_true', help='replace an existing database')
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        if not args.force:
+            parser.error('{} exists, pass --force to replace it'.format(args.path))
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.path + suffix):
+                os.remove(args.path + suffix)
+    seed(args.path, args.users, args.categories, args.jobs, args.applications, args.favourites, args.seed)
+
+
+if __name__ == '__main__':
+    main()
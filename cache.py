@@ -0,0 +1,180 @@
+import sqlite3
+import time
+from collections import OrderedDict
+
+
+_MISSING = object()
+VERSION_CHECK_INTERVAL = 0.005
+
+
+class TTLCache:
+    """Bounded in-process LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            self.misses += 1
+            return default
+
+        value, expires_at = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        item = self._data.pop(key, None)
+        return item[0] if item else None
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+class TableVersions:
+    """Reads the trigger-maintained `table_versions` counters.
+
+    `PRAGMA data_version` only changes when some connection commits, so the
+    counters are re-read only then; the check itself is a cheap pragma on a
+    dedicated connection, opened lazily so it is never shared across forks.
+
+    It runs on the event loop, so it runs at most once per `interval` and
+    never waits for a lock: while another connection holds one the last
+    counters stand until the next check. Local writes call `expire()` so
+    that this worker sees its own changes at once.
+    """
+
+    def __init__(self, path, interval=VERSION_CHECK_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._connection = None
+        self._data_version = None
+        self._checked_at = float('-inf')
+        self._versions = {}
+
+    def expire(self):
+        self._checked_at = float('-inf')
+
+    def version(self, table):
+        now = time.monotonic()
+        if now - self._checked_at >= self.interval:
+            self._refresh()
+            self._checked_at = now
+        return self._versions.get(table, 0)
+
+    def _refresh(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=0, isolation_level=None, check_same_thread=False)
+        try:
+            data_version = self._connection.execute('PRAGMA data_version').fetchone()[0]
+            if data_version != self._data_version:
+                self._versions = dict(self._connection.execute('SELECT name, version FROM table_versions'))
+                self._data_version = data_version
+        except sqlite3.OperationalError:
+            pass
+
+
+class TableCache(TTLCache):
+    """Read-through cache of rows from one table.
+
+    Local writes evict their own keys; a change of the table version (a
+    write from any worker) empties the whole cache.
+    """
+
+    def __init__(self, versions, table, maxsize=1024, ttl=60):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.versions = versions
+        self.table = table
+        self.invalidations = 0
+        self._version = None
+
+    def sync(self):
+        version = self.versions.version(self.table)
+        if version != self._version:
+            if self._version is not None:
+                self.invalidations += 1
+            self.clear()
+            self._version = version
+        return version
+
+    async def get_or_load(self, key, loader):
+        version = self.sync()
+        value = self.get(key)
+        if value is None:
+            value = await loader()
+            # a write that landed while loading may have made `value` stale
+            if value is not None and self.sync() == version:
+                self.set(key, value)
+        return value
+
+    def stats(self):
+        return {**super().stats(), 'invalidations': self.invalidations}
+
+
+class TableSnapshot:
+    """All rows of a small reference table, held in memory.
+
+    `stale()` costs one `table_versions` check; the owner reloads the rows
+    when it says so. The version is taken before loading, so a write that
+    lands during the load makes the next check reload again.
+    """
+
+    def __init__(self, versions, table, key):
+        self.versions = versions
+        self.table = table
+        self.key = key
+        self.rows = ()
+        self.keys = frozenset()
+        self.loads = 0
+        self.hits = 0
+        self._version = None
+
+    def stale(self):
+        version = self.versions.version(self.table)
+        if version == self._version:
+            self.hits += 1
+            return None
+        return version
+
+    def replace(self, version, rows):
+        self.rows = tuple(rows)
+        self.keys = frozenset(row[self.key] for row in self.rows)
+        self.loads += 1
+        self._version = version
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.rows)
+
+    def stats(self):
+        return {'size': len(self.rows), 'maxsize': len(self.rows), 'hits': self.hits, 'misses': self.loads}
@@ -0,0 +1,325 @@
+import asyncio
+import contextlib
+import os
+import time
+
+import aiosqlite
+import databases
+from databases.backends import sqlite as sqlite_backend
+from databases.core import Connection as BaseConnection
+from sqlalchemy.sql.expression import Insert
+
+
+# Applied to every connection the app opens: the async pool below, the
+# SQLAlchemy engine and the migration runner. WAL lets readers keep going
+# while a write commits; journal_mode persists in the file, the rest is
+# per connection.
+PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -64 * 1024),
+    ('busy_timeout', 5000),
+]
+
+READ_POOL_SIZE = int(os.environ.get('SQLITE_READ_POOL_SIZE', 4))
+
+# Writes queue for the single writer connection of the process; past these
+# limits they fail with WriteQueueFull instead of piling up.
+MAX_PENDING_WRITES = 1000
+WRITE_QUEUE_TIMEOUT = 5
+
+
+# Called with (sql, parameters, seconds) after every statement run
+# through the pool.
+QUERY_LISTENERS = []
+
+
+PRAGMA_SCRIPT = ''.join('PRAGMA {} = {};'.format(name, value) for name, value in PRAGMAS)
+
+
+def configure(connection):
+    """Apply PRAGMAS to a DB-API sqlite3 connection."""
+    for name, value in PRAGMAS:
+        connection.execute('PRAGMA {} = {}'.format(name, value))
+
+
+def notify_listeners(statement, parameters, seconds):
+    for listener in QUERY_LISTENERS:
+        listener(statement, parameters, seconds)
+
+
+class WriteQueueFull(Exception):
+    pass
+
+
+class SQLitePool:
+    """A pool of read connections plus one serialized writer connection."""
+
+    def __init__(self, url, size=READ_POOL_SIZE, **options):
+        self._url = url
+        self._options = options
+        self.size = size
+        self._idle = []
+        self._readers = None
+        self._writer = None
+        self._write_lock = None
+        self.pending_writes = 0
+        self.ready = False
+
+    async def _open(self):
+        connection = aiosqlite.connect(database=self._url.database, isolation_level=None, **self._options)
+        await connection.__aenter__()
+        await connection.executescript(PRAGMA_SCRIPT)
+        # the first statement loads the schema, better here than in a request
+        async with connection.execute('SELECT count(*) FROM sqlite_master') as cursor:
+            await cursor.fetchone()
+        return connection
+
+    async def open(self):
+        # Created here rather than in __init__ so they bind to the worker's
+        # running loop; the connections are opened up front so the first
+        # requests don't pay for them.
+        self._readers = asyncio.Semaphore(self.size)
+        self._write_lock = asyncio.Lock()
+        self._writer = await self._open()
+        self._idle = [await self._open() for _ in range(self.size)]
+        self.ready = True
+
+    async def close(self):
+        self.ready = False
+        for connection in self._idle + [self._writer]:
+            if connection is not None:
+                await connection.__aexit__(None, None, None)
+        self._idle = []
+        self._writer = None
+
+    def stats(self):
+        return {
+            'readers': self.size,
+            'idle_readers': len(self._idle),
+            'pending_writes': self.pending_writes,
+        }
+
+    async def acquire_reader(self):
+        await self._readers.acquire()
+        try:
+            if self._idle:
+                return self._idle.pop()
+            return await self._open()
+        except Exception:
+            self._readers.release()
+            raise
+
+    async def release_reader(self, connection):
+        self._idle.append(connection)
+        self._readers.release()
+
+    async def acquire_writer(self):
+        if self.pending_writes >= MAX_PENDING_WRITES:
+            raise WriteQueueFull()
+        self.pending_writes += 1
+        try:
+            await asyncio.wait_for(self._write_lock.acquire(), WRITE_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise WriteQueueFull()
+        finally:
+            self.pending_writes -= 1
+        return self._writer
+
+    def release_writer(self):
+        self._write_lock.release()
+
+
+class SQLiteConnection(sqlite_backend.SQLiteConnection):
+    """Picks a pooled connection per statement instead of per task.
+
+    Reads borrow a reader, writes wait for the writer; a transaction holds
+    the writer from BEGIN to COMMIT so everything inside it, reads
+    included, runs on that one connection.
+    """
+
+    def __init__(self, pool, dialect):
+        super().__init__(pool, dialect)
+        self._transactions = 0
+        self._statement = None
+        self._parameters = None
+
+    async def acquire(self):
+        pass
+
+    async def release(self):
+        pass
+
+    @contextlib.asynccontextmanager
+    async def _using(self, write):
+        if self._transactions:
+            yield
+            return
+        pool = self._pool
+        self._connection = await (pool.acquire_writer() if write else pool.acquire_reader())
+        try:
+            yield
+        finally:
+            connection, self._connection = self._connection, None
+            if write:
+                pool.release_writer()
+            else:
+                await pool.release_reader(connection)
+
+    def _compile(self, query):
+        compiled = super()._compile(query)
+        self._statement, self._parameters = compiled[0], compiled[1]
+        return compiled
+
+    def _notify(self, seconds):
+        notify_listeners(self._statement, self._parameters, seconds)
+
+    async def _timed(self, operation):
+        # time spent waiting for a pooled connection is not included
+        started = time.perf_counter()
+        try:
+            return await operation
+        finally:
+            self._notify(time.perf_counter() - started)
+
+    async def fetch_all(self, query):
+        async with self._using(write=False):
+            return await self._timed(super().fetch_all(query))
+
+    async def fetch_one(self, query):
+        async with self._using(write=False):
+            return await self._timed(super().fetch_one(query))
+
+    async def _execute(self, query):
+        # The writer is long-lived and `lastrowid` is its last insert of any
+        # statement, so it only means something for an insert that added a
+        # row; everything else reports rowcount, 0 for an ignored insert.
+        sql, args, _ = self._compile(query)
+        cursor = await self._connection.execute(sql, args)
+        try:
+            if isinstance(query, Insert) and cursor.rowcount > 0:
+                return cursor.lastrowid
+            return cursor.rowcount
+        finally:
+            await cursor.close()
+
+    async def execute(self, query):
+        async with self._using(write=True):
+            return await self._timed(self._execute(query))
+
+    async def execute_many(self, queries):
+        async with self._using(write=True):
+            for query in queries:
+                await self._timed(self._execute(query))
+
+    async def iterate(self, query):
+        # only the time spent fetching rows counts, not the caller's
+        async with self._using(write=False):
+            rows = super().iterate(query)
+            elapsed = 0.0
+            try:
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        row = await rows.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        elapsed += time.perf_counter() - started
+                    yield row
+            finally:
+                await rows.aclose()
+                self._notify(elapsed)
+
+    def transaction(self):
+        return SQLiteTransaction(self)
+
+    async def begin(self):
+        if not self._transactions:
+            self._connection = await self._pool.acquire_writer()
+        self._transactions += 1
+
+    def end(self):
+        self._transactions -= 1
+        if not self._transactions:
+            self._connection = None
+            self._pool.release_writer()
+
+
+class SQLiteTransaction(sqlite_backend.SQLiteTransaction):
+    # Every transaction is a write transaction on the writer: IMMEDIATE
+    # takes the file lock at BEGIN, so other workers' writers wait on
+    # busy_timeout there rather than failing halfway through.
+
+    async def start(self, is_root):
+        await self._connection.begin()
+        try:
+            self._is_root = is_root
+            if is_root:
+                cursor = await self._connection._connection.execute('BEGIN IMMEDIATE')
+                await cursor.close()
+            else:
+                await super().start(is_root)
+        except Exception:
+            self._connection.end()
+            raise
+
+    async def commit(self):
+        try:
+            await super().commit()
+        finally:
+            self._connection.end()
+
+    async def rollback(self):
+        try:
+            await super().rollback()
+        finally:
+            self._connection.end()
+
+
+class SQLiteBackend(sqlite_backend.SQLiteBackend):
+    def __init__(self, database_url, **options):
+        super().__init__(database_url, **options)
+        self._pool = SQLitePool(self._database_url, **self._options)
+
+    @property
+    def pool(self):
+        return self._pool
+
+    async def connect(self):
+        await self._pool.open()
+
+    async def disconnect(self):
+        await self._pool.close()
+
+    def connection(self):
+        return SQLiteConnection(self._pool, self._dialect)
+
+
+class Connection(BaseConnection):
+    async def iterate(self, query, values=None):
+        # The stock iterate wraps the SELECT in a transaction, which here
+        # would hold the writer for as long as the caller keeps iterating.
+        # A single SELECT already reads one consistent snapshot.
+        built_query = self._build_query(query, values)
+        async with self._query_lock:
+            async for record in self._connection.iterate(built_query):
+                yield record
+
+
+class Database(databases.Database):
+    SUPPORTED_BACKENDS = {
+        **databases.Database.SUPPORTED_BACKENDS,
+        'sqlite': 'connections:SQLiteBackend',
+    }
+
+    def connection(self):
+        if self._global_connection is not None:
+            return self._global_connection
+        try:
+            return self._connection_context.get()
+        except LookupError:
+            connection = Connection(self._backend)
+            self._connection_context.set(connection)
+            return connection
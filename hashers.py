@@ -0,0 +1,152 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Stored hashes look like `<algorithm>$<cost parameters>$<salt>$<hash>`, so
+# the cost can be raised later without breaking existing rows. Rows created
+# before this module hold a bare SHA-256 hex digest; they still verify and
+# are re-hashed with the default hasher on the next successful login.
+DEFAULT_HASHER = 'pbkdf2_sha256'
+PBKDF2_ITERATIONS = 260000
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+# Slow KDFs run in this pool, never on the event loop; the limiter keeps
+# waiting logins parked as cheap coroutines instead of piling up threads.
+MAX_CONCURRENT_HASHES = min(4, os.cpu_count() or 1)
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+def _b64decode(data):
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+
+class PasswordHasher:
+    algorithm = None
+
+    def encode(self, password):
+        raise NotImplementedError
+
+    def verify(self, password, encoded):
+        raise NotImplementedError
+
+    def needs_rehash(self, encoded):
+        return True
+
+
+class PBKDF2Hasher(PasswordHasher):
+    algorithm = 'pbkdf2_sha256'
+
+    def __init__(self, iterations=PBKDF2_ITERATIONS):
+        self.iterations = iterations
+
+    def _derive(self, password, salt, iterations):
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+
+    def encode(self, password):
+        salt = os.urandom(16)
+        digest = self._derive(password, salt, self.iterations)
+        return '$'.join([self.algorithm, str(self.iterations), _b64encode(salt), _b64encode(digest)])
+
+    def verify(self, password, encoded):
+        _, iterations, salt, digest = encoded.split('$')
+        candidate = self._derive(password, _b64decode(salt), int(iterations))
+        return hmac.compare_digest(candidate, _b64decode(digest))
+
+    def needs_rehash(self, encoded):
+        return int(encoded.split('$')[1]) != self.iterations
+
+
+class ScryptHasher(PasswordHasher):
+    algorithm = 'scrypt'
+
+    def __init__(self, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def _derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+
+    def encode(self, password):
+        salt = os.urandom(16)
+        digest = self._derive(password, salt, self.n, self.r, self.p)
+        params = [str(self.n), str(self.r), str(self.p)]
+        return '$'.join([self.algorithm, *params, _b64encode(salt), _b64encode(digest)])
+
+    def verify(self, password, encoded):
+        _, n, r, p, salt, digest = encoded.split('$')
+        candidate = self._derive(password, _b64decode(salt), int(n), int(r), int(p))
+        return hmac.compare_digest(candidate, _b64decode(digest))
+
+    def needs_rehash(self, encoded):
+        return encoded.split('$')[1:4] != [str(self.n), str(self.r), str(self.p)]
+
+
+class LegacySHA256Hasher(PasswordHasher):
+    algorithm = 'sha256'
+
+    def encode(self, password):
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    def verify(self, password, encoded):
+        return hmac.compare_digest(self.encode(password), encoded)
+
+
+HASHERS = {
+    hasher.algorithm: hasher
+    for hasher in (PBKDF2Hasher(), ScryptHasher(), LegacySHA256Hasher())
+}
+
+
+def get_hasher(algorithm=DEFAULT_HASHER):
+    return HASHERS[algorithm]
+
+def identify_hasher(encoded):
+    if '$' not in encoded:
+        return HASHERS['sha256']
+    return HASHERS[encoded.split('$', 1)[0]]
+
+
+def encode_password(password):
+    return get_hasher().encode(password)
+
+def check_password(password, encoded):
+    try:
+        hasher = identify_hasher(encoded)
+        valid = hasher.verify(password, encoded)
+    except (KeyError, ValueError):
+        return False, False
+    needs_rehash = hasher.algorithm != DEFAULT_HASHER or hasher.needs_rehash(encoded)
+    return valid, valid and needs_rehash
+
+
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_HASHES, thread_name_prefix='password-hasher')
+_limiter = None
+
+
+def _get_limiter():
+    # Created lazily so it binds to the worker's running event loop.
+    global _limiter
+    if _limiter is None:
+        _limiter = asyncio.Semaphore(MAX_CONCURRENT_HASHES)
+    return _limiter
+
+async def _run(func, *args):
+    async with _get_limiter():
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(_executor, func, *args)
+
+async def hash_password(password):
+    return await _run(encode_password, password)
+
+async def verify_password(password, encoded):
+    """Return `(valid, needs_rehash)` for a password against its stored hash."""
+    return await _run(check_password, password, encoded)
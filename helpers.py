@@ -1,47 +1,78 @@
-from model import User
-
-import hashlib, uuid
+import time
 import jwt
 from datetime import datetime, timedelta
+from fastapi import Header
+from typing import NamedTuple
+
+from cache import TTLCache
 
 JWT_SECRET = 'screel_labs_assessment_jwt_secret'
 JWT_ALGORITHM = 'HS256'
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 300
+
 
+class Principal(NamedTuple):
+    user_id: int
+    role: str
+    expires_at: float
 
-def encode_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
 
-def decode_password(password):
-    return hashlib.sha256(password.decode())
+# Clients send the same token to many endpoints, so verified tokens are
+# kept for a while; an entry never outlives the token's own expiry.
+verified_tokens = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
 
 def genrate_token(user):
     data={
         'user_id':user['user_id'],
         'role':user['role'],
-        'expire':str(datetime.now() + timedelta(days=30)),
+        'exp':int(time.time() + timedelta(days=30).total_seconds()),
     }
     token = jwt.encode(data, JWT_SECRET, JWT_ALGORITHM).decode('utf-8')
     return token
 
+def token_expiry(payload):
+    if 'exp' in payload:
+        return float(payload['exp'])
+    # tokens issued before the numeric `exp` claim carry a datetime string
+    return datetime.fromisoformat(payload['expire']).timestamp()
+
 def verify_token(token=None):
-    if token:
-        try:
-            user = jwt.decode(token, JWT_SECRET, JWT_ALGORITHM)
-            if user['expire'] < str(datetime.now):
-                return user
-            return False
-        except:
-            return False
-    else:
-        return False
+    if not token:
+        return None
+
+    principal = verified_tokens.get(token)
+    if principal:
+        return principal
+
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        principal = Principal(int(payload['user_id']), payload['role'], token_expiry(payload))
+    except (jwt.InvalidTokenError, KeyError, TypeError, ValueError):
+        return None
+
+    remaining = principal.expires_at - time.time()
+    if remaining <= 0:
+        return None
+    verified_tokens.set(token, principal, ttl=min(TOKEN_CACHE_TTL, remaining))
+    return principal
 
 def verify_token_with_role(token=None, expected_role=None):
-    if token and expected_role:
-        try:
-            user = jwt.decode(token, JWT_SECRET, JWT_ALGORITHM)
-            if user['role'] == expected_role and user['expire'] < str(datetime.now):
-                return user
-            return False
-        except:
-            return False
-    return False
+    principal = verify_token(token)
+    if principal and expected_role and principal.role == expected_role:
+        return principal
+    return None
+
+
+# FastAPI dependencies: the token header is decoded once per request and
+# the handler receives a Principal, or None when the token is missing,
+# invalid or expired, so each route keeps its own error response.
+
+async def current_user(token: str = Header(None)):
+    return verify_token(token)
+
+def current_user_with_role(expected_role):
+    async def dependency(token: str = Header(None)):
+        return verify_token_with_role(token, expected_role)
+    return dependency
@@ -0,0 +1,112 @@
+import math
+import os
+import time
+
+from fastapi.responses import JSONResponse
+
+from cache import TTLCache
+from helpers import verify_token
+import metrics
+
+
+# Admission control, in front of every route: a per-router token bucket per
+# client (the user id of a valid token, else the client address), and a cap
+# on the requests a worker handles at once. Both are in-process. With
+# WEB_CONCURRENCY workers each bucket holds the full burst but refills at
+# its share of the rate, so a client that stays on one connection gets the
+# configured burst and 1/WEB_CONCURRENCY of the sustained rate, and one
+# spread over all the workers gets at most the configured rate overall.
+WORKERS = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAX_CONCURRENT_REQUESTS', 100))
+RATE_LIMIT_BUCKETS = 100000
+EXEMPT_PATHS = ('/health/', '/metrics')
+
+
+def parse_rate(value):
+    # '<requests>/<seconds>', e.g. '10/60'; the burst is the whole allowance
+    requests, seconds = value.split('/')
+    return float(requests), float(seconds)
+
+
+# router prefix -> (requests, seconds); '0/1' turns a limit off
+RATE_LIMITS = {
+    '/auth': parse_rate(os.environ.get('RATE_LIMIT_AUTH', '10/60')),
+    '/users': parse_rate(os.environ.get('RATE_LIMIT_USERS', '50/1')),
+    '/jobs': parse_rate(os.environ.get('RATE_LIMIT_JOBS', '50/1')),
+}
+
+
+class TokenBucket:
+    def __init__(self, requests, seconds, workers=WORKERS):
+        self.capacity = max(1.0, requests)
+        self.rate = requests / workers / seconds
+        # time for an empty bucket to fill up again
+        self.seconds = self.capacity / self.rate
+
+    def take(self, buckets, key):
+        """Seconds to wait before retrying, 0 when the request may go ahead."""
+        now = time.monotonic()
+        tokens, stamp = buckets.get(key) or (self.capacity, now)
+        tokens = min(self.capacity, tokens + (now - stamp) * self.rate)
+        wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+        if not wait:
+            tokens -= 1
+        # an idle bucket is full again after `seconds`, so it can expire then
+        buckets.set(key, (tokens, now), ttl=self.seconds)
+        return wait
+
+
+limits = {prefix: TokenBucket(*rate) for prefix, rate in RATE_LIMITS.items() if rate[0]}
+buckets = TTLCache(maxsize=RATE_LIMIT_BUCKETS, ttl=max([limit.seconds for limit in limits.values()] + [1]))
+
+
+def router_of(path):
+    for prefix in limits:
+        if path == prefix or path.startswith(prefix + '/'):
+            return prefix
+    return None
+
+def client_key(scope):
+    for name, value in scope['headers']:
+        if name == b'token':
+            principal = verify_token(value.decode('latin-1'))
+            if principal:
+                return 'user:{}'.format(principal.user_id)
+            break
+    client = scope.get('client')
+    return 'ip:{}'.format(client[0] if client else 'unknown')
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, max_concurrent=MAX_CONCURRENT_REQUESTS):
+        self.app = app
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'].startswith(EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        prefix = router_of(scope['path'])
+        if prefix is not None:
+            wait = limits[prefix].take(buckets, (prefix, client_key(scope)))
+            if wait:
+                metrics.registry.inc('http_requests_rejected_total', (('reason', 'rate_limit'), ('router', prefix)))
+                response = {'detail': 'TOO MANY REQUESTS', 'status': 429}
+                headers = {'Retry-After': str(math.ceil(wait))}
+                await JSONResponse(status_code=429, content=response, headers=headers)(scope, receive, send)
+                return
+
+        # shed load here rather than let requests pile up on the database
+        if self.in_flight >= self.max_concurrent:
+            metrics.registry.inc('http_requests_rejected_total', (('reason', 'overload'), ('router', prefix or '/')))
+            response = {'detail': 'SERVER BUSY, TRY AGAIN LATER', 'status': 503}
+            await JSONResponse(status_code=503, content=response, headers={'Retry-After': '1'})(scope, receive, send)
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
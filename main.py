@@ -1,165 +1,268 @@
-from fastapi import Body, APIRouter, status, Header
+from fastapi import Body, APIRouter, Depends, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 
+from pydantic import ValidationError
 from typing import List
 from datetime import datetime
+import csv
+import enum
+import io
+import json
+import logging
+import re
+import sqlite3
+import zlib
 import uvicorn
-import databases
-from pluck import pluck
 
-from base import DATABASE, app
+from base import app
 from validation import (
     UserValidator,
     LoginValidator,
     JobCategoryValidator,
     JobValidator,
     AppliedJobValidator,
-    FavouriteJobValidator
+    FavouriteJobValidator,
+    ApplicationStatusValidator,
 )
+from responses import (
+    DisconnectAwareStreamingResponse,
+    DuplexStreamingResponse,
+    FastJSONResponse,
+    NotModifiedResponse,
+    entity_tag,
+    is_conditional,
+    is_fresh,
+    row_to_dict,
+    rows_to_dicts,
+    validators,
+)
+from pagination import NEXT_CURSOR_HEADER, InvalidCursor, decode_cursor, next_cursor
+from hashers import hash_password, verify_password
+from connections import QUERY_LISTENERS, WriteQueueFull
 from helpers import (
-    encode_password,
-    decode_password,
+    Principal,
     genrate_token,
-    verify_token,
-    verify_token_with_role,
+    current_user,
+    current_user_with_role,
+    verified_tokens,
 )
 
-from model import engine, User, JobCategory, Job, FavouriteJob, AppliedJob, Skill
+from model import Job, AppliedJob, FavouriteJob, JobType, JobStatus
+import repository
+import migrations
+import metrics
+import limits
+from slowlog import slow_queries
+
+
+logger = logging.getLogger(__name__)
 
-from sqlalchemy.orm import sessionmaker
-Session = sessionmaker(bind = engine)
-session = Session()
 
+# Public representations; the password hash never leaves the server.
+USER_FIELDS = [field for field in UserValidator.__fields__ if field != 'password']
+JOB_FIELDS = list(JobValidator.__fields__)
+CATEGORY_FIELDS = list(JobCategoryValidator.__fields__)
 
-database = databases.Database(DATABASE)
 user_router = APIRouter()
 auth_router = APIRouter()
 job_router = APIRouter()
+export_router = APIRouter()
 
+# outermost last: metrics see every response, and rejected requests still
+# carry the CORS headers a browser needs to read Retry-After
+app.add_middleware(limits.AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=['http://localhost:8080'],
     allow_credentials=True,
     allow_methods=['*'],
-    allow_headers=['*']
+    allow_headers=['*'],
+    expose_headers=[NEXT_CURSOR_HEADER, 'ETag', 'Last-Modified', 'Retry-After'],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+
+QUERY_LISTENERS.append(metrics.record_query)
+QUERY_LISTENERS.append(slow_queries.record_query)
+
+
+@metrics.register_collector
+def collect_cache_and_pool(registry):
+    caches = {
+        'jobs': repository.job_cache,
+        'tokens': verified_tokens,
+        'favourite_counts': repository.favourite_counts,
+        'categories': repository.categories,
+        'rate_limit_buckets': limits.buckets,
+    }
+    for name, cache in caches.items():
+        stats = cache.stats()
+        labels = (('cache', name),)
+        registry.set('cache_hits_total', labels, stats['hits'])
+        registry.set('cache_misses_total', labels, stats['misses'])
+        registry.set('cache_entries', labels, stats['size'])
+    pool = repository.pool_stats()
+    registry.set('db_pool_idle_readers', (), pool['idle_readers'])
+    registry.set('db_pool_pending_writes', (), pool['pending_writes'])
+
+
+@app.exception_handler(WriteQueueFull)
+async def write_queue_full(request: Request, exc: WriteQueueFull):
+    response = {'detail': 'SERVER BUSY, TRY AGAIN LATER', 'status': 503}
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=response, headers={'Retry-After': '1'})
 
 
 @app.on_event('startup')
 async def startup():
-    await database.connect()
+    # startup.sh migrates once before any worker starts, so here this is a
+    # single PRAGMA user_version read; it still covers a bare `uvicorn main:app`.
+    migrations.migrate()
+    await repository.connect()
+    metrics.start()
 
 @app.on_event('shutdown')
 async def shutdown():
-    await database.disconnect()
+    metrics.stop()
+    await repository.disconnect()
+
+
+@app.get('/health/live', include_in_schema=False)
+async def health_live():
+    return {'detail': 'ALIVE', 'status': 200}
+
+@app.get('/health/ready', include_in_schema=False)
+async def health_ready():
+    # ready once this worker's connection pool is open and warm
+    if not repository.is_ready():
+        response = {'detail': 'NOT READY', 'status': 503}
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=response)
+    response = {'detail': 'READY', 'status': 200}
+    return JSONResponse(status_code=status.HTTP_200_OK, content=response)
+
+
+@app.get('/metrics', include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(metrics.snapshots()), media_type='text/plain; version=0.0.4')
 
 
 
 @user_router.get('/', response_model=List[UserValidator])
-async def get_all_users(skip: int = 0, paginate: int = 20):
-    users = User.select().offset(skip).limit(paginate)
-    return await database.fetch_all(users)
+async def get_all_users(skip: int = 0, paginate: int = Query(20, ge=1, le=100), cursor: str = None):
+    if cursor is None:
+        users = await repository.get_users(skip, paginate)
+    else:
+        try:
+            after_id, _ = decode_cursor(cursor)
+        except InvalidCursor:
+            response = {'detail':'INVALID CURSOR', 'status': 400}
+            return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content=response)
+        users = await repository.get_users_after(after_id, paginate)
+
+    cursor = next_cursor(users, paginate)
+    headers = {NEXT_CURSOR_HEADER: cursor} if cursor else {}
+    return FastJSONResponse(content=rows_to_dicts(users, USER_FIELDS), headers=headers)
 
 
 @user_router.post('/', response_model=UserValidator)
 async def create_user(user: UserValidator):
-    query = User.select().where(User.c.username == user.username)
-    is_exist = await database.fetch_one(query)
+    is_exist = await repository.get_user_by_username(user.username)
     if is_exist:
         response = {'detail':'USERNAME NOT AVAILABLE', 'status': 406}
         return JSONResponse(status_code=status.HTTP_406_NOT_ACCEPTABLE, content=response)
 
-    query = User.insert().values(
+    last_record_id = await repository.create_user(
         username=user.username,
-        password=encode_password(user.password),
+        password=await hash_password(user.password),
         first_name=user.first_name,
         last_name=user.last_name,
         gender=user.gender,
         phone=user.phone,
         role=user.role,
     )
-    last_record_id = await database.execute(query)
     return {**user.dict(), "ID": last_record_id}
 
 
 @user_router.get('/{user_id}', response_model=UserValidator)
-async def get_user(user_id: int):
-    query = User.select().where(User.c.id == user_id)
-    is_exist = await database.fetch_one(query)
+async def get_user(user_id: int, request: Request):
+    # a revalidation only reads the version; the row when it has changed
+    if is_conditional(request.headers):
+        current = await repository.get_user_version(user_id)
+        if current and is_fresh(request.headers, entity_tag('user', user_id, current.version), current.updated_at):
+            return NotModifiedResponse(entity_tag('user', user_id, current.version), current.updated_at)
+
+    is_exist = await repository.get_user(user_id)
     if not is_exist:
         response = {'detail':  'USER NOT FOUND', 'status': 404}
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content=response)
 
-    return is_exist
+    headers = validators(entity_tag('user', user_id, is_exist.version), is_exist.updated_at)
+    return FastJSONResponse(content=row_to_dict(is_exist, USER_FIELDS), headers=headers)
 
 
 @user_router.put('/{user_id}', response_model=UserValidator)
-async def update_user(user_id: int, user: UserValidator, token: str = Header(None)):
-    query = User.select().where(User.c.id == user_id)
-    is_exist = await database.fetch_one(query)
+async def update_user(user_id: int, user: UserValidator, authenticated_user: Principal = Depends(current_user)):
+    is_exist = await repository.get_user(user_id)
     if not is_exist:
         response = {'detail':  'USER NOT FOUND', 'status': 404}
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content=response)
 
-    authenticated_user = verify_token(token)
     if not authenticated_user:
         response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
 
-    if user_id != authenticated_user['user_id']:
+    if user_id != authenticated_user.user_id:
         response = {'detail':'UNAUTHORIZED ACCESS(YOU CAN UPDATE YOUR ACCOUNT ONLY)', 'status': 401}
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
 
     if user.username:
-        query = User.select().where(User.c.username == user.username)
-        is_exist_username = await database.fetch_one(query)
+        is_exist_username = await repository.get_user_by_username(user.username)
         if is_exist_username and is_exist_username.id != user_id:
             response = {'detail':'USERNAME NOT AVAILABLE', 'status': 406}
             return JSONResponse(status_code=status.HTTP_406_NOT_ACCEPTABLE, content=response)
 
-    query = User.update().where(User.c.id == user_id).values(
+    await repository.update_user(
+        user_id,
         username = user.username if user.username else is_exist.username,
-        password = encode_password(user.password) if user.password else is_exist.password,
+        password = await hash_password(user.password) if user.password else is_exist.password,
         first_name = user.first_name if user.first_name else is_exist.first_name,
         last_name = user.last_name if user.last_name else is_exist.last_name,
         phone = user.phone if user.phone else is_exist.phone,
         gender = user.gender if user.gender else is_exist.gender,
         role = user.role if user.role else is_exist.role,
     )
-    await database.execute(query)
     return {**user.dict(), "ID": user_id}
 
 
 @user_router.delete('/{user_id}')
-async def delete_user(user_id: int, token: str = Header(None)):
-    authenticated_user = verify_token(token)
+async def delete_user(user_id: int, authenticated_user: Principal = Depends(current_user)):
     if not authenticated_user:
         response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
 
-    if user_id != authenticated_user['user_id']:
+    if user_id != authenticated_user.user_id:
         response = {'detail':'UNAUTHORIZED ACCESS(YOU CAN DELETE YOUR ACCOUNT ONLY)', 'status': 401}
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
 
-    query = User.delete().where(User.c.id == user_id)
-    await database.execute(query)
+    await repository.delete_user(user_id)
     response = {'detail':"USER ID: {} DELETED SUCCESSFULLY".format(user_id), 'status': 200}
     return JSONResponse(status_code=status.HTTP_200_OK, content=response)
 
 
 @auth_router.post('/login', response_model=LoginValidator)
 async def login(user: LoginValidator):
-    query = User.select().where(User.c.username == user.username)
-    is_exist = await database.fetch_one(query)
+    is_exist = await repository.get_user_by_username(user.username)
     if not is_exist:
         response = {'detail':'USERNAME NOT AVAILABLE', 'status': 404}
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content=response)
 
-    if is_exist.password != encode_password(user.password):
+    valid, needs_rehash = await verify_password(user.password, is_exist.password)
+    if not valid:
         response = {'detail':'WRONG PASSWORD', 'status': 400}
         return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content=response)
 
+    if needs_rehash:
+        await repository.update_user(is_exist.id, password=await hash_password(user.password))
+
     data = {
         'user_id': is_exist.id,
         'role': is_exist.role.value
@@ -170,26 +273,19 @@ async def login(user: LoginValidator):
 
 
 @auth_router.post('/refresh')
-async def refresh_token(token: str = Header(None)):
-    user = verify_token(token)
+async def refresh_token(user: Principal = Depends(current_user)):
     if not user:
         response = {'detail':'INVALID OR EXPIRED TOKEN', 'status': 403}
         return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content=response)
 
-    token = genrate_token(user)
+    token = genrate_token(user._asdict())
     response = {'detail':'TOKEN REFRESHED','token':  token, 'status': 200}
     return JSONResponse(status_code=status.HTTP_200_OK, content=response)
 
 
-@job_router.post('/', response_model=JobValidator)
-async def create_job(job: JobValidator, token: str = Header(None)):
-    authenticated_user = verify_token_with_role(token, expected_role='recruiter')
-    if not authenticated_user:
-        response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
-        return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
-
-    query = Job.insert().values(
-        created_by=authenticated_user['user_id'],
+def new_job_values(job, created_by):
+    return dict(
+        created_by=created_by,
         category=job.category,
         company_name=job.company_name,
         job_title=job.job_title,
@@ -198,62 +294,228 @@ async def create_job(job: JobValidator, token: str = Header(None)):
         experiance_max=job.experiance_max,
         job_count=job.job_count,
         location=job.location,
-        status='cr',
+        status=JobStatus.cr,
         description_short=job.description_short,
         description_long=job.description_long,
     )
-    session.execute(query)
-    session.commit()
+
+
+@job_router.post('/', response_model=JobValidator)
+async def create_job(job: JobValidator, authenticated_user: Principal = Depends(current_user_with_role('recruiter'))):
+    if not authenticated_user:
+        response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
+        return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
+
+    if not await repository.category_exists(job.category):
+        response = {'detail': 'JOB CATEGORY NOT FOUND', 'status': 406}
+        return JSONResponse(status_code=status.HTTP_406_NOT_ACCEPTABLE, content=response)
+
+    await repository.create_job(**new_job_values(job, authenticated_user.user_id))
     return {**job.dict()}
 
 
+BULK_BATCH_SIZE = 500
+MAX_LINE_LENGTH = 1024 * 1024
+
+
+async def ndjson_lines(stream):
+    # Yields complete lines as they arrive, or None for a line longer than
+    # MAX_LINE_LENGTH, which is dropped so memory stays bounded.
+    buffer = b''
+    skipping = False
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield None if skipping or len(line) > MAX_LINE_LENGTH else line
+            skipping = False
+        if len(buffer) > MAX_LINE_LENGTH:
+            buffer = b''
+            skipping = True
+    if buffer or skipping:
+        yield None if skipping else buffer
+
+def failed_lines(lines, status_code, detail):
+    return [{'line': line, 'status': status_code, 'detail': detail} for line in lines]
+
+def insert_error(error):
+    # The import stream has already answered 200, so errors that would
+    # otherwise become a 503 or a 500 are reported on the lines they hit.
+    if isinstance(error, WriteQueueFull):
+        return 503, 'SERVER BUSY, TRY AGAIN LATER'
+    logger.error('bulk import insert failed', exc_info=error)
+    return 500, 'INTERNAL SERVER ERROR'
+
+async def insert_job_batch(batch):
+    try:
+        await repository.create_jobs([values for _, values in batch])
+        return [{'line': line, 'status': 200} for line, _ in batch]
+    except sqlite3.Error:
+        pass
+    except Exception as error:
+        return failed_lines([line for line, _ in batch], *insert_error(error))
+
+    # something in the batch was rejected: insert line by line to report it
+    results = []
+    for line, values in batch:
+        try:
+            await repository.create_job(**values)
+            results.append({'line': line, 'status': 200})
+        except sqlite3.Error as error:
+            results.append({'line': line, 'status': 406, 'detail': str(error)})
+        except Exception as error:
+            results.extend(failed_lines([line], *insert_error(error)))
+    return results
+
+
+@job_router.post('/bulk')
+async def bulk_create_jobs(request: Request, authenticated_user: Principal = Depends(current_user_with_role('recruiter'))):
+    if not authenticated_user:
+        response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
+        return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
+
+    async def import_jobs():
+        batch = []
+        created = failed = line_number = 0
+        outcome, outcome_status = 'BULK IMPORT FINISHED', 200
+        # Unknown categories are remembered for the whole import, and at
+        # most one line per batch rechecks a miss: each recheck is a
+        # blocking read on the event loop.
+        missing = set()
+        recheck = True
+        try:
+            async for line in ndjson_lines(request.stream()):
+                line_number += 1
+                results = []
+                if line is None:
+                    results.append({'line': line_number, 'status': 413, 'detail': 'LINE TOO LONG'})
+                elif line.strip():
+                    try:
+                        job = JobValidator(**json.loads(line))
+                        if job.category not in missing and await repository.category_exists(job.category, recheck):
+                            batch.append((line_number, new_job_values(job, authenticated_user.user_id)))
+                        else:
+                            recheck = False
+                            missing.add(job.category)
+                            results.append({'line': line_number, 'status': 406, 'detail': 'JOB CATEGORY NOT FOUND'})
+                    except ValidationError as error:
+                        results.append({'line': line_number, 'status': 422, 'detail': json.loads(error.json())})
+                    except (ValueError, TypeError):
+                        results.append({'line': line_number, 'status': 400, 'detail': 'INVALID JSON OBJECT'})
+
+                if len(batch) >= BULK_BATCH_SIZE:
+                    results.extend(await insert_job_batch(batch))
+                    batch = []
+                    recheck = True
+                for result in results:
+                    if result['status'] == 200:
+                        created += 1
+                    else:
+                        failed += 1
+                    yield json.dumps(result) + '\n'
+
+            results = await insert_job_batch(batch) if batch else []
+        except Exception as error:
+            # the lines still waiting for their batch fail with the import,
+            # and the summary below is still sent
+            outcome_status, detail = insert_error(error)
+            results = failed_lines([line for line, _ in batch], outcome_status, detail)
+            outcome = 'BULK IMPORT STOPPED'
+
+        for result in results:
+            if result['status'] == 200:
+                created += 1
+            else:
+                failed += 1
+            yield json.dumps(result) + '\n'
+        yield json.dumps({'detail': outcome, 'created': created, 'failed': failed, 'status': outcome_status}) + '\n'
+
+    return DuplexStreamingResponse(import_jobs(), media_type='application/x-ndjson')
+
+
 @job_router.post('/category', response_model=JobCategoryValidator)
-async def create_category(category: JobCategoryValidator, token: str = Header(None)):
-    authenticated_user = verify_token_with_role(token, expected_role='recruiter')
+async def create_category(category: JobCategoryValidator, authenticated_user: Principal = Depends(current_user_with_role('recruiter'))):
     if not authenticated_user:
         response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
 
-    query = JobCategory.insert().values(
-        added_by=authenticated_user['user_id'],
+    await repository.create_category(
+        added_by=authenticated_user.user_id,
         name=category.name,
     )
-    session.execute(query)
-    session.commit()
     return {**category.dict()}
 
 
 @job_router.get('/category', response_model=List[JobCategoryValidator])
-async def get_categories(skip: int = 0):
-    categories = JobCategory.select().offset(skip)
-    return await database.fetch_all(categories)
+async def get_categories(request: Request, skip: int = 0):
+    etag = entity_tag('categories', repository.table_version('job_categories'))
+    if is_fresh(request.headers, etag):
+        return NotModifiedResponse(etag)
+
+    categories = await repository.get_categories(skip)
+    return FastJSONResponse(content=rows_to_dicts(categories, CATEGORY_FIELDS), headers=validators(etag))
+
+
+@job_router.get('/search')
+async def search_jobs(q: str = None, paginate: int = Query(20, ge=1, le=100), cursor: str = None):
+    after = None
+    if cursor is not None:
+        try:
+            after_id, filters = decode_cursor(cursor)
+            q, after = filters['q'], (float(filters['score']), after_id)
+        except (InvalidCursor, KeyError, TypeError, ValueError):
+            response = {'detail':'INVALID CURSOR', 'status': 400}
+            return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content=response)
+
+    terms = re.findall(r'\w+', q or '')
+    if not terms:
+        response = {'detail':'EMPTY SEARCH QUERY', 'status': 400}
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content=response)
+
+    rows = await repository.search_jobs(terms, after, paginate)
+    jobs = [{**row_to_dict(row, JOB_FIELDS), 'score': row.score, 'snippet': row.snippet} for row in rows]
+
+    cursor = next_cursor(rows, paginate, lambda last: {'q': q, 'score': last['score']})
+    headers = {NEXT_CURSOR_HEADER: cursor} if cursor else {}
+    response = {'Jobs': jobs, 'status': 200}
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=response, headers=headers)
+
+
+@job_router.get('/cache/stats')
+async def get_job_cache_stats():
+    response = {'job_cache': repository.job_cache.stats(), 'status': 200}
+    return JSONResponse(status_code=status.HTTP_200_OK, content=response)
 
 
 @job_router.get('/{job_id}', response_model=JobValidator)
-async def get_job(job_id: int):
-    query = Job.select().where(Job.c.id == job_id)
-    is_exist = await database.fetch_one(query)
+async def get_job(job_id: int, request: Request):
+    if is_conditional(request.headers):
+        current = await repository.get_job_version(job_id)
+        if current and is_fresh(request.headers, entity_tag('job', job_id, current.version), current.updated_at):
+            return NotModifiedResponse(entity_tag('job', job_id, current.version), current.updated_at)
+
+    is_exist = await repository.get_job(job_id)
     if not is_exist:
         response = {'detail':  'JOB NOT FOUND', 'status': 404}
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content=response)
 
-    return is_exist
+    headers = validators(entity_tag('job', job_id, is_exist.version), is_exist.updated_at)
+    return FastJSONResponse(content=row_to_dict(is_exist, JOB_FIELDS), headers=headers)
 
 
 @job_router.put('/{job_id}', response_model=JobValidator)
-async def update_job(job_id: int, job: JobValidator, token: str = Header(None)):
-    query = Job.select().where(Job.c.id == job_id)
-    is_exist = await database.fetch_one(query)
+async def update_job(job_id: int, job: JobValidator, authenticated_user: Principal = Depends(current_user_with_role('recruiter'))):
+    is_exist = await repository.get_job(job_id)
     if not is_exist:
         response = {'detail':  'JOB NOT FOUND', 'status': 404}
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content=response)
 
-    authenticated_user = verify_token_with_role(token, expected_role='recruiter')
-    if not authenticated_user or is_exist.created_by != authenticated_user['user_id']:
+    if not authenticated_user or is_exist.created_by != authenticated_user.user_id:
         response = {'detail':'UNAUTHORIZED ACCESS(ONLY JOB OWNER CAN UPDATE THE JOB)', 'status': 401}
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
 
-    query = Job.update().where(Job.c.id == job_id).values(
+    last_record_id = await repository.update_job(
+        job_id,
         company_name = job.company_name if job.company_name else is_exist.company_name,
         job_title = job.job_title if job.job_title else is_exist.job_title,
         job_type = job.job_type if job.job_type else is_exist.job_type,
@@ -265,234 +527,421 @@ async def update_job(job_id: int, job: JobValidator, token: str = Header(None)):
         description_short = job.description_short if job.description_short else is_exist.description_short,
         description_long = job.description_long if job.description_long else is_exist.description_long,
     )
-    last_record_id = await database.execute(query)
-    await database.execute(query)
     return {**job.dict(), "ID": last_record_id}
 
 
 @job_router.delete('/{job_id}')
-async def delete_job(job_id: int, token: str = Header(None)):
-    authenticated_user = verify_token(token)
+async def delete_job(job_id: int, authenticated_user: Principal = Depends(current_user)):
     if not authenticated_user:
         response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
 
-    query = Job.select().where(Job.c.id == job_id)
-    is_exist = await database.fetch_one(query)
+    is_exist = await repository.get_job(job_id)
     if not is_exist:
         response = {'detail':  'JOB NOT FOUND', 'status': 404}
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content=response)
 
-    if is_exist.created_by != authenticated_user['user_id']:
+    if is_exist.created_by != authenticated_user.user_id:
         response = {'detail':'UNAUTHORIZED ACCESS(YOU CAN DELETE YOUR JOB ONLY)', 'status': 401}
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
 
-    query = Job.update().where(Job.c.id == job_id).values(
-        status = 'd'
-    )
-    await database.execute(query)
+    await repository.update_job(job_id, status='d')
     response = {'detail':"JOB ID: {} DELETED SUCCESSFULLY".format(job_id), 'status': 200}
     return JSONResponse(status_code=status.HTTP_200_OK, content=response)
 
 
+JOB_FILTERS = ('category', 'job_type', 'status', 'experiance_min', 'experiance_max', 'location')
+
+
+def job_filter_values(filters):
+    if set(filters) - set(JOB_FILTERS):
+        raise ValueError(filters)
+    values = dict(filters)
+    if 'job_type' in values:
+        values['job_type'] = JobType(values['job_type'])
+    if 'status' in values:
+        values['status'] = JobStatus(values['status'])
+    return values
+
+
 @job_router.get('/', response_model=List[JobValidator])
-async def get_all_jobs(skip: int = 0, paginate: int = 20):
-    jobs = Job.select().offset(skip).limit(paginate)
-    return await database.fetch_all(jobs)
+async def get_all_jobs(
+    request: Request,
+    skip: int = 0,
+    paginate: int = Query(20, ge=1, le=100),
+    cursor: str = None,
+    category: str = None,
+    job_type: JobType = None,
+    job_status: JobStatus = Query(None, alias='status'),
+    experiance_min: float = None,
+    experiance_max: float = None,
+    location: str = None,
+):
+    # any committed change to jobs bumps the table version, so the version
+    # alone identifies every page of every filter
+    etag = entity_tag('jobs', repository.table_version('jobs'))
+    if is_fresh(request.headers, etag):
+        return NotModifiedResponse(etag)
+
+    if cursor is None:
+        filters = {
+            'category': category,
+            'job_type': job_type.value if job_type else None,
+            'status': job_status.value if job_status else None,
+            'experiance_min': experiance_min,
+            'experiance_max': experiance_max,
+            'location': location,
+        }
+        filters = {name: value for name, value in filters.items() if value is not None}
+        jobs = await repository.get_jobs(skip, paginate, **job_filter_values(filters))
+    else:
+        try:
+            after_id, filters = decode_cursor(cursor)
+            job_filters = job_filter_values(filters)
+        except (InvalidCursor, ValueError):
+            response = {'detail':'INVALID CURSOR', 'status': 400}
+            return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content=response)
+        jobs = await repository.get_jobs_after(after_id, paginate, **job_filters)
+
+    cursor = next_cursor(jobs, paginate, filters)
+    headers = validators(etag)
+    if cursor:
+        headers[NEXT_CURSOR_HEADER] = cursor
+    return FastJSONResponse(content=rows_to_dicts(jobs, JOB_FIELDS), headers=headers)
 
 
 @job_router.get('/my/posted', response_model=List[JobValidator])
-async def get_all_my_posted_jobs(token: str = Header(None)):
-    authenticated_user = verify_token_with_role(token, expected_role='recruiter')
+async def get_all_my_posted_jobs(authenticated_user: Principal = Depends(current_user_with_role('recruiter'))):
     if not authenticated_user:
         response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
 
-    jobs = session.query(Job).filter(Job.c.created_by == authenticated_user['user_id'])
+    jobs = await repository.get_jobs_created_by(authenticated_user.user_id)
     all_jobs = []
     for job in jobs:
-        if job and job.status.value == 'deleted':
-            pass
-        else:
-            all_jobs.append({
-                'id': job.id,
-                'company_name': job.company_name,
-                'job_title': job.job_title,
-                'job_type': job.job_type.value,
-                'experiance_min': job.experiance_min,
-                'experiance_max': job.experiance_max,
-                'job_count': job.job_count,
-                'location': job.location,
-                'job_status': job.status.value if job.status else 'NA',
-            })
+        all_jobs.append({
+            'id': job.id,
+            'company_name': job.company_name,
+            'job_title': job.job_title,
+            'job_type': job.job_type.value,
+            'experiance_min': job.experiance_min,
+            'experiance_max': job.experiance_max,
+            'job_count': job.job_count,
+            'location': job.location,
+            'job_status': job.status.value if job.status else 'NA',
+        })
     response = {'Jobs': all_jobs, 'status': 200}
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=response)
+
+
+def applicant_details(row):
+    return {
+        'apply_id': row.apply_id,
+        'status': row.status.value if row.status else 'NA',
+        'user': {
+            'id': row.id,
+            'first_name': row.first_name,
+            'last_name': row.last_name,
+            'email': row.username,
+            'phone': row.phone,
+            'gender': row.gender.value if row.gender else None,
+        },
+    }
+
+
+async def owned_job(job_id, authenticated_user):
+    # (job, error response) for routes reserved to the job's recruiter
+    if not authenticated_user:
+        response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
+        return None, JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
+
+    is_exist = await repository.get_job(job_id)
+    if not is_exist:
+        response = {'detail':  'JOB NOT FOUND', 'status': 404}
+        return None, JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content=response)
+
+    if is_exist.created_by != authenticated_user.user_id:
+        response = {'detail':'UNAUTHORIZED ACCESS(ONLY JOB OWNER CAN MANAGE APPLICANTS)', 'status': 401}
+        return None, JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
+    return is_exist, None
+
+
+@job_router.get('/{job_id}/applicants')
+async def get_job_applicants(
+    job_id: int,
+    paginate: int = Query(20, ge=1, le=100),
+    cursor: str = None,
+    applicant_status: JobStatus = Query(None, alias='status'),
+    authenticated_user: Principal = Depends(current_user_with_role('recruiter')),
+):
+    _, error = await owned_job(job_id, authenticated_user)
+    if error:
+        return error
+
+    after_id = 0
+    if cursor is not None:
+        try:
+            after_id, filters = decode_cursor(cursor)
+            applicant_status = JobStatus(filters['status']) if 'status' in filters else None
+        except (InvalidCursor, ValueError):
+            response = {'detail':'INVALID CURSOR', 'status': 400}
+            return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content=response)
+
+    rows = await repository.get_job_applicants(job_id, applicant_status, after_id, paginate)
+    filters = {'status': applicant_status.value} if applicant_status else None
+    cursor = next_cursor(rows, paginate, filters, key='apply_id')
+    headers = {NEXT_CURSOR_HEADER: cursor} if cursor else {}
+    response = {'Applicants': [applicant_details(row) for row in rows], 'status': 200}
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=response, headers=headers)
+
+
+@job_router.put('/{job_id}/applicants/status')
+async def set_applicants_status(
+    job_id: int,
+    batch: ApplicationStatusValidator,
+    authenticated_user: Principal = Depends(current_user_with_role('recruiter')),
+):
+    _, error = await owned_job(job_id, authenticated_user)
+    if error:
+        return error
+
+    apply_ids = set(batch.apply_ids)
+    updated = await repository.set_application_status(job_id, sorted(apply_ids), batch.status)
+    missing = sorted(apply_ids - set(updated))
+    response = {
+        'detail': 'APPLICANTS MOVED TO {}'.format(batch.status.value.upper()),
+        'Updated': sorted(updated),
+        'Missing': missing,
+        'status': 200,
+    }
     return JSONResponse(status_code=status.HTTP_200_OK, content=response)
 
 
+@job_router.get('/my/dashboard')
+async def get_recruiter_dashboard(
+    paginate: int = Query(20, ge=1, le=100),
+    cursor: str = None,
+    authenticated_user: Principal = Depends(current_user_with_role('recruiter')),
+):
+    if not authenticated_user:
+        response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
+        return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
+
+    after_id = 0
+    if cursor is not None:
+        try:
+            after_id, _ = decode_cursor(cursor)
+        except InvalidCursor:
+            response = {'detail':'INVALID CURSOR', 'status': 400}
+            return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content=response)
+
+    jobs = await repository.get_job_dashboard(authenticated_user.user_id, after_id, paginate)
+    all_jobs = []
+    for job in jobs:
+        all_jobs.append({
+            'id': job.id,
+            'job_title': job.job_title,
+            'company_name': job.company_name,
+            'location': job.location,
+            'job_count': job.job_count,
+            'job_status': job.status.value if job.status else 'NA',
+            'applications': {
+                'total': job.application_count,
+                'applied': job.applied_count,
+                'selected': job.selected_count,
+                'rejected': job.rejected_count,
+                'filled': job.filled_count,
+            },
+            'favourites': job.favourite_count,
+        })
+
+    cursor = next_cursor(jobs, paginate)
+    headers = {NEXT_CURSOR_HEADER: cursor} if cursor else {}
+    response = {'Jobs': all_jobs, 'status': 200}
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=response, headers=headers)
+
+
 @user_router.post('/jobs/{job_id}', response_model=AppliedJobValidator)
-async def apply_job(job_id: int, job: AppliedJobValidator, token: str = Header(None)):
-    authenticated_user = verify_token(token)
+async def apply_job(job_id: int, job: AppliedJobValidator, authenticated_user: Principal = Depends(current_user)):
     if not authenticated_user:
         response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
 
-    query = Job.select().where(Job.c.id == job_id)
-    is_exist = await database.fetch_one(query)
+    is_exist = await repository.get_job(job_id)
     if not is_exist:
         response = {'detail':  'REQUESTED JOB NOT FOUND', 'status': 404}
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content=response)
 
-    query = session.query(AppliedJob).filter(AppliedJob.c.job_id == job_id, AppliedJob.c.user_id == authenticated_user['user_id']).first()
-    if query:
+    applied = await repository.create_application(
+        user_id=authenticated_user.user_id,
+        job_id=job_id,
+        status='a',
+    )
+    if not applied:
         response = {'detail':  'ALREADY APPLIED', 'status': 406}
         return JSONResponse(status_code=status.HTTP_406_NOT_ACCEPTABLE, content=response)
 
-    query = AppliedJob.insert().values(
-        user_id=authenticated_user['user_id'],
-        job_id=job_id,
-        status='applied',
-    )
-    apply = AppliedJob.insert().values(user_id=authenticated_user['user_id'], job_id=job_id, status='a')
-    session.execute(apply)
-    session.commit()
     response = {'detail':  'SUCCESSFULLY APPLIED', 'status': 200}
     return JSONResponse(status_code=status.HTTP_200_OK, content=response)
 
 
-@user_router.get('/jobs/my/{apply_id}')
-async def get_my_job(apply_id: int, token: str = Header(None)):
-    authenticated_user = verify_token(token)
-    if not authenticated_user:
-        response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
-        return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
-
-    my_job = session.query(AppliedJob).filter(AppliedJob.c.id == apply_id).first()
-    if not my_job:
-        response = {'detail':  'JOB NOT FOUND', 'status': 404}
-        return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content=response)
+MAX_BATCH_SIZE = 100
 
-    job = session.query(Job).filter(Job.c.id == my_job.job_id).first()
-    if not job:
-        response = {'detail':  'JOB NOT FOUND', 'status': 404}
-        return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content=response)
 
-    recruiter = session.query(User).filter(User.c.id == job.created_by).first()
+def application_details(row):
     recruiter_details = 'NA'
-    if recruiter:
+    if row.recruiter_id:
         recruiter_details = {
-            'id': recruiter.id,
-            'first_name': recruiter.first_name,
-            'last_name': recruiter.last_name,
-            'email': recruiter.username,
-            'phone': recruiter.phone,
-            'gender': recruiter.gender,
+            'id': row.recruiter_id,
+            'first_name': row.recruiter_first_name,
+            'last_name': row.recruiter_last_name,
+            'email': row.recruiter_username,
+            'phone': row.recruiter_phone,
+            'gender': row.recruiter_gender.value if row.recruiter_gender else None,
         }
-    data = {
-        'my_status': my_job.status.value if my_job.status else 'NA',
+    return {
+        'apply_id': row.apply_id,
+        'my_status': row.my_status.value if row.my_status else 'NA',
         'job_details': {
-            'id': job.id,
-            'company_name': job.company_name,
-            'job_title': job.job_title,
-            'job_type': job.job_type,
-            'experiance_min': job.experiance_min,
-            'experiance_max': job.experiance_max,
-            'job_count': job.job_count,
-            'location': job.location,
-            'job_status': job.status.value if job.status else 'NA',
+            'id': row.id,
+            'company_name': row.company_name,
+            'job_title': row.job_title,
+            'job_type': row.job_type.value if row.job_type else None,
+            'experiance_min': row.experiance_min,
+            'experiance_max': row.experiance_max,
+            'job_count': row.job_count,
+            'location': row.location,
+            'job_status': row.status.value if row.status else 'NA',
         },
         'recruiter_details': recruiter_details
     }
 
-    response = {'Job details': data, 'status': 200}
-    return JSONResponse(status_code=status.HTTP_200_OK, content=response)
 
+@user_router.get('/jobs/my/batch')
+async def get_my_jobs_batch(apply_ids: List[int] = Query(...), authenticated_user: Principal = Depends(current_user)):
+    if not authenticated_user:
+        response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
+        return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
 
-@user_router.get('/jobs/my')
-async def get_my_all_jobs(token: str = Header(None)):
-    authenticated_user = verify_token(token)
+    apply_ids = set(apply_ids)
+    if len(apply_ids) > MAX_BATCH_SIZE:
+        response = {'detail':'TOO MANY IDS (MAX {})'.format(MAX_BATCH_SIZE), 'status': 400}
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content=response)
+
+    rows = await repository.get_applied_job_details(authenticated_user.user_id, apply_ids)
+    jobs = [application_details(row) for row in rows]
+    missing = sorted(apply_ids - {job['apply_id'] for job in jobs})
+    response = {'Jobs': jobs, 'Missing': missing, 'status': 200}
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=response)
+
+
+@user_router.get('/jobs/my/{apply_id}')
+async def get_my_job(apply_id: int, authenticated_user: Principal = Depends(current_user)):
     if not authenticated_user:
         response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
 
-    my_jobs = session.query(AppliedJob).filter(AppliedJob.c.user_id == authenticated_user['user_id'])
-    if my_jobs.count() == 0:
-        response = {'detail':  'JOBS NOT FOUND', 'status': 404}
+    rows = await repository.get_applied_job_details(authenticated_user.user_id, [apply_id])
+    if not rows:
+        response = {'detail':  'JOB NOT FOUND', 'status': 404}
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content=response)
 
-    job_ids = pluck(my_jobs, 'job_id')
-    job_ids = set(job_ids)
-    total_jobs = len(job_ids)
-    jobs = session.query(Job).filter(Job.c.id.in_(job_ids))
-    if jobs.count() == 0:
-        response = {'detail':  'JOBS NOT FOUND', 'status': 404}
-        return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content=response)
+    response = {'Job details': application_details(rows[0]), 'status': 200}
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=response)
+
+
+@user_router.get('/jobs/my')
+async def get_my_all_jobs(paginate: int = Query(20, ge=1, le=100), cursor: str = None, authenticated_user: Principal = Depends(current_user)):
+    if not authenticated_user:
+        response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
+        return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
+
+    after_id = 0
+    if cursor is not None:
+        try:
+            after_id, _ = decode_cursor(cursor)
+        except InvalidCursor:
+            response = {'detail':'INVALID CURSOR', 'status': 400}
+            return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content=response)
 
     my_all_jobs = []
-    for my_job in my_jobs:
-        for job in jobs:
-            if my_job.job_id == job.id:
-                data = {
-                    'my_status': my_job.status.value if my_job.status else 'NA',
-                    'job_details': {
-                        'id': job.id,
-                        'company_name': job.company_name,
-                        'job_title': job.job_title,
-                        'job_type': job.job_type.value,
-                        'experiance_min': job.experiance_min,
-                        'experiance_max': job.experiance_max,
-                        'job_count': job.job_count,
-                        'location': job.location,
-                        'job_status': job.status.value if job.status else 'NA',
-                    }
-                }
-                my_all_jobs.append(data)
+    async for row in repository.iterate_applied_jobs(authenticated_user.user_id, after_id, paginate):
+        my_all_jobs.append({
+            'apply_id': row.apply_id,
+            'my_status': row.my_status.value if row.my_status else 'NA',
+            'job_details': {
+                'id': row.id,
+                'company_name': row.company_name,
+                'job_title': row.job_title,
+                'job_type': row.job_type.value if row.job_type else None,
+                'experiance_min': row.experiance_min,
+                'experiance_max': row.experiance_max,
+                'job_count': row.job_count,
+                'location': row.location,
+                'job_status': row.status.value if row.status else 'NA',
+            }
+        })
+
+    if not my_all_jobs and cursor is None:
+        response = {'detail':  'JOBS NOT FOUND', 'status': 404}
+        return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content=response)
 
+    cursor = next_cursor(my_all_jobs, paginate, key='apply_id')
+    headers = {NEXT_CURSOR_HEADER: cursor} if cursor else {}
+    # counted on its own: a page past the end has no rows to carry it
+    total_jobs = await repository.count_applied_jobs(authenticated_user.user_id)
     response = {'Total': total_jobs, 'Jobs': my_all_jobs, 'status': 200}
-    return JSONResponse(status_code=status.HTTP_200_OK, content=response)
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=response, headers=headers)
 
 
 @user_router.post('/favourite/{job_id}')
-async def add_favourite(job_id: int, token: str = Header(None)):
-    authenticated_user = verify_token(token)
+async def add_favourite(job_id: int, authenticated_user: Principal = Depends(current_user)):
     if not authenticated_user:
         response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
 
-    query = session.query(FavouriteJob).filter(FavouriteJob.c.user_id==authenticated_user['user_id'], FavouriteJob.c.job_id==job_id).first()
-    if not query:
-        query = FavouriteJob.insert().values(
-            user_id=authenticated_user['user_id'],
-            job_id=job_id,
-            is_liked=True,
-        )
-        session.execute(query)
-        session.commit()
+    await repository.create_favourite(
+        user_id=authenticated_user.user_id,
+        job_id=job_id,
+        is_liked=True,
+    )
 
     response = {'detail':'FAVOURITE JOB ADDED', 'status': 200}
     return JSONResponse(status_code=status.HTTP_200_OK, content=response)
 
 
 @user_router.delete('/favourite/{favourite_id}')
-async def remove_favourite(favourite_id: int, token: str = Header(None)):
-    authenticated_user = verify_token(token)
+async def remove_favourite(favourite_id: int, authenticated_user: Principal = Depends(current_user)):
     if not authenticated_user:
         response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
 
-    query = FavouriteJob.delete().where(FavouriteJob.c.id == favourite_id)
-    await database.execute(query)
+    await repository.delete_favourite(favourite_id, authenticated_user.user_id)
     response = {'detail':"FAVOURITE JOB REMOVED", 'status': 200}
     return JSONResponse(status_code=status.HTTP_200_OK, content=response)
 
 
 @user_router.get('/favourites/all')
-async def get_favourite(token: str = Header(None)):
-    authenticated_user = verify_token(token)
+async def get_favourite(
+    paginate: int = Query(20, ge=1, le=100),
+    cursor: str = None,
+    include_jobs: bool = False,
+    authenticated_user: Principal = Depends(current_user),
+):
     if not authenticated_user:
         response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
 
-    favourites = session.query(FavouriteJob).all()
+    after_job_id = 0
+    if cursor is not None:
+        try:
+            after_job_id, filters = decode_cursor(cursor)
+            include_jobs = bool(filters.get('include_jobs'))
+        except InvalidCursor:
+            response = {'detail':'INVALID CURSOR', 'status': 400}
+            return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content=response)
+
+    favourites = await repository.get_user_favourites(authenticated_user.user_id, after_job_id, paginate, include_jobs)
     all_favourite = []
     for d in favourites:
         data = {
@@ -500,13 +949,95 @@ async def get_favourite(token: str = Header(None)):
             'user_id': d.user_id,
             'job_id': d.job_id,
         }
+        if include_jobs:
+            data['job'] = {
+                'job_title': d.job_title,
+                'company_name': d.company_name,
+                'location': d.location,
+                'job_type': d.job_type.value if d.job_type else None,
+                'job_status': d.status.value if d.status else 'NA',
+            }
         all_favourite.append(data)
-    response = {'Favourites':all_favourite, 'status': 200}
-    return JSONResponse(status_code=status.HTTP_200_OK, content=response)
+
+    cursor = next_cursor(favourites, paginate, {'include_jobs': include_jobs}, key='job_id')
+    headers = {NEXT_CURSOR_HEADER: cursor} if cursor else {}
+    total = await repository.count_user_favourites(authenticated_user.user_id)
+    response = {'Total': total, 'Favourites': all_favourite, 'status': 200}
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=response, headers=headers)
+
+
+EXPORT_TABLES = {
+    'jobs': Job,
+    'applied_jobs': AppliedJob,
+    'favourite_jobs': FavouriteJob,
+}
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+EXPORT_FLUSH_ROWS = 500
+
+
+def export_value(value):
+    return value.value if isinstance(value, enum.Enum) else value
+
+async def export_rows(table, fmt):
+    columns = [column.name for column in table.c]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(columns)
+
+    count = 0
+    async for row in repository.iterate_table(table):
+        values = [export_value(row[name]) for name in columns]
+        if fmt == 'csv':
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(columns, values))) + '\n')
+        count += 1
+        if count % EXPORT_FLUSH_ROWS == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+async def gzipped(chunks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@export_router.get('/{table}')
+async def export_table(
+    table: str,
+    fmt: str = Query('ndjson', alias='format', regex='^(ndjson|csv)$'),
+    gzip: bool = False,
+    authenticated_user: Principal = Depends(current_user_with_role('admin')),
+):
+    if not authenticated_user:
+        response = {'detail':'UNAUTHORIZED ACCESS', 'status': 401}
+        return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=response)
+
+    if table not in EXPORT_TABLES:
+        response = {'detail':'UNKNOWN TABLE', 'status': 404}
+        return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content=response)
+
+    content = export_rows(EXPORT_TABLES[table], fmt)
+    headers = {'Content-Disposition': 'attachment; filename="{}.{}"'.format(table, fmt)}
+    if gzip:
+        content = gzipped(content)
+        headers['Content-Encoding'] = 'gzip'
+    return DisconnectAwareStreamingResponse(content, media_type=EXPORT_FORMATS[fmt], headers=headers)
 
 
 app.include_router(user_router, prefix='/users')
 app.include_router(auth_router, prefix='/auth')
 app.include_router(job_router, prefix='/jobs')
+app.include_router(export_router, prefix='/export')
 if __name__ == '__main__':
     uvicorn.run(app, host='127.0.0.1', port=8000)
\ No newline at end of file
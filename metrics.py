@@ -0,0 +1,273 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import re
+import threading
+import time
+
+
+# Each worker keeps its own registry. With METRICS_DIR set (shared by all
+# gunicorn workers) every worker also writes it to `<pid>.json` there, and
+# /metrics sums the files, so whichever worker answers the scrape reports
+# the whole server. Counters of workers that have exited still count, their
+# gauges are left out; startup.sh empties the directory before the workers
+# start, so nothing carries over from a previous run.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP responses by method, route and status.'),
+    'http_requests_in_flight': ('gauge', 'HTTP requests being handled.'),
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency by method and route.', LATENCY_BUCKETS),
+    'http_request_queries': ('histogram', 'SQL statements run per HTTP request.', QUERY_COUNT_BUCKETS),
+    'http_request_query_seconds': ('histogram', 'Time spent in SQL per HTTP request.', LATENCY_BUCKETS),
+    'http_requests_rejected_total': ('counter', 'Requests turned away by admission control, by reason and router.'),
+    'db_query_duration_seconds': ('histogram', 'SQL statement latency by statement fingerprint.', QUERY_BUCKETS),
+    'cache_hits_total': ('counter', 'In-process cache hits.'),
+    'cache_misses_total': ('counter', 'In-process cache misses.'),
+    'cache_entries': ('gauge', 'Entries held by in-process caches.'),
+    'db_pool_idle_readers': ('gauge', 'Idle read connections.'),
+    'db_pool_pending_writes': ('gauge', 'Writes waiting for the writer connection.'),
+}
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {}
+        self.histograms = {}
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, labels=(), value=0):
+        with self._lock:
+            self.values[(name, labels)] = value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[index] += 1
+                    break
+            else:
+                histogram[len(buckets)] += 1
+            histogram[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'values': [[name, list(labels), value] for (name, labels), value in self.values.items()],
+                'histograms': [[name, list(labels), list(counts)] for (name, labels), counts in self.histograms.items()],
+            }
+
+
+registry = Registry()
+collectors = []
+
+
+def register_collector(collector):
+    """Add a callable run before every snapshot to set point-in-time values."""
+    collectors.append(collector)
+    return collector
+
+def collect():
+    for collector in collectors:
+        collector(registry)
+    return registry.snapshot()
+
+
+# per-request SQL accounting: [statements, seconds]
+request_queries = contextvars.ContextVar('request_queries', default=None)
+request_scope = contextvars.ContextVar('request_scope', default=None)
+
+_routes = {}
+
+
+def route_of(scope):
+    # the route template, not the path, keeps label values bounded
+    if not _routes:
+        _routes.update(
+            (route.endpoint, route.path) for route in scope['app'].routes if hasattr(route, 'endpoint')
+        )
+    return _routes.get(scope.get('endpoint'), 'unmatched')
+
+def current_route():
+    """Route template of the request being handled, if any."""
+    scope = request_scope.get()
+    return route_of(scope) if scope is not None else None
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(statement):
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'\b\d+(?:\.\d+)?\b', '?', statement)
+    statement = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(?, ...)', statement)
+    return ' '.join(statement.split())
+
+def record_query(statement, parameters, seconds):
+    registry.observe('db_query_duration_seconds', (('statement', fingerprint(statement)),), seconds)
+    queries = request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+        queries[1] += seconds
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        queries = [0, 0.0]
+        token = request_queries.set(queries)
+        scope_token = request_scope.set(scope)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        registry.inc('http_requests_in_flight')
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.inc('http_requests_in_flight', value=-1)
+            request_queries.reset(token)
+            request_scope.reset(scope_token)
+            labels = (('method', scope['method']), ('route', route_of(scope)))
+            registry.inc('http_requests_total', labels + (('status', str(status)),))
+            registry.observe('http_request_duration_seconds', labels, elapsed)
+            registry.observe('http_request_queries', labels, queries[0])
+            registry.observe('http_request_query_seconds', labels, queries[1])
+
+
+# multi-worker files
+
+def _path(pid):
+    return os.path.join(METRICS_DIR, '{}.json'.format(pid))
+
+def dump():
+    snapshot = collect()
+    if METRICS_DIR:
+        temporary = _path(os.getpid()) + '.tmp'
+        with open(temporary, 'w') as output:
+            json.dump(snapshot, output)
+        os.replace(temporary, _path(os.getpid()))
+    return snapshot
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def snapshots():
+    own = dump()
+    if not METRICS_DIR:
+        return [own]
+    result = []
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith('.json'):
+            continue
+        pid = int(name[:-len('.json')])
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (OSError, ValueError):
+            continue
+        if not _alive(pid):
+            snapshot['values'] = [value for value in snapshot['values'] if METRICS[value[0]][0] != 'gauge']
+        result.append(snapshot)
+    return result
+
+
+def merge(snapshots):
+    values = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['values']:
+            key = (name, tuple(map(tuple, labels)))
+            values[key] = values.get(key, 0) + value
+        for name, labels, counts in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [0] * len(counts))
+            for index, count in enumerate(counts):
+                merged[index] += count
+    return values, histograms
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escape = lambda value: str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{' + ','.join('{}="{}"'.format(name, escape(value)) for name, value in labels) + '}'
+
+def render(snapshots):
+    """Prometheus text exposition format (version 0.0.4)."""
+    values, histograms = merge(snapshots)
+    lines = []
+    for name, (kind, help_text, *options) in METRICS.items():
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        if kind != 'histogram':
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append('{}{} {}'.format(name, _labels(labels), value))
+            continue
+        buckets = options[0]
+        for (metric, labels), counts in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(name, _labels(labels + (('le', bound),)), cumulative))
+            lines.append('{}_sum{} {}'.format(name, _labels(labels), counts[-1]))
+            lines.append('{}_count{} {}'.format(name, _labels(labels), cumulative))
+    return '\n'.join(lines) + '\n'
+
+
+_flusher = None
+
+
+async def _flush_periodically():
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+        dump()
+
+def start():
+    global _flusher
+    if METRICS_DIR and _flusher is None:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _flusher = asyncio.ensure_future(_flush_periodically())
+
+def stop():
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        _flusher = None
+        dump()
@@ -0,0 +1,210 @@
+import sqlite3
+
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateTable, CreateIndex
+
+from base import DATABASE_PATH
+from connections import configure
+from model import metadata, User
+
+
+# Schema changes are applied by version, tracked in SQLite's
+# `PRAGMA user_version`. Migration 1 creates whatever tables are missing
+# from the current metadata, so on a fresh database it already contains
+# everything that later migrations add: those must stay idempotent
+# (IF NOT EXISTS, column checks) to be safe on both fresh and old databases.
+
+
+# Content columns: writes to these count as changes to the row, while
+# bookkeeping columns (versions, timestamps) can change freely.
+JOB_COLUMNS = [
+    'category', 'created_by', 'company_name', 'job_title', 'job_type', 'experiance_min',
+    'experiance_max', 'job_count', 'location', 'status', 'description_short', 'description_long',
+]
+USER_COLUMNS = ['username', 'password', 'first_name', 'last_name', 'phone', 'gender', 'role']
+
+# Denormalized counters on jobs and the query each one caches. Triggers keep
+# them current; the queries are for backfilling and reconciliation.
+JOB_COUNTERS = {
+    'application_count': "SELECT count(*) FROM applied_jobs WHERE job_id = jobs.id",
+    'applied_count': "SELECT count(*) FROM applied_jobs WHERE job_id = jobs.id AND status = 'a'",
+    'selected_count': "SELECT count(*) FROM applied_jobs WHERE job_id = jobs.id AND status = 's'",
+    'rejected_count': "SELECT count(*) FROM applied_jobs WHERE job_id = jobs.id AND status = 'r'",
+    'filled_count': "SELECT count(*) FROM applied_jobs WHERE job_id = jobs.id AND status = 'f'",
+    'favourite_count': "SELECT count(*) FROM favourite_jobs WHERE job_id = jobs.id",
+}
+
+
+def create_schema(cursor):
+    dialect = sqlite.dialect()
+    existing = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for table in metadata.sorted_tables:
+        if table.name in existing:
+            continue
+        cursor.execute(str(CreateTable(table).compile(dialect=dialect)))
+        for index in table.indexes:
+            cursor.execute(str(CreateIndex(index).compile(dialect=dialect)))
+
+def add_lookup_indexes(cursor):
+    # The app used to enforce these with select-then-insert, so older
+    # databases may hold duplicates that would block the unique indexes.
+    cursor.execute("DELETE FROM applied_jobs WHERE id NOT IN (SELECT MIN(id) FROM applied_jobs GROUP BY user_id, job_id)")
+    cursor.execute("DELETE FROM favourite_jobs WHERE id NOT IN (SELECT MIN(id) FROM favourite_jobs GROUP BY user_id, job_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_jobs_created_by_status ON jobs (created_by, status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status_category ON jobs (status, category)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_jobs_category ON jobs (category)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_skills_job_id ON skills (job_id)")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_applied_jobs_user_job ON applied_jobs (user_id, job_id)")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_favourite_jobs_user_job ON favourite_jobs (user_id, job_id)")
+
+def track_versions(cursor, table, columns):
+    # Updates only count when they touch one of `columns`, so bookkeeping
+    # columns can change without invalidating every cached row.
+    cursor.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 0)", (table,))
+    bump = "UPDATE table_versions SET version = version + 1 WHERE name = '{}';".format(table)
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS {0}_version_insert AFTER INSERT ON {0} BEGIN {1} END".format(table, bump))
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS {0}_version_update AFTER UPDATE OF {1} ON {0} BEGIN {2} END".format(table, ', '.join(columns), bump))
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS {0}_version_delete AFTER DELETE ON {0} BEGIN {1} END".format(table, bump))
+
+def add_table_versions(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS table_versions (name VARCHAR(64) NOT NULL, version INTEGER NOT NULL, PRIMARY KEY (name))")
+    track_versions(cursor, 'jobs', JOB_COLUMNS)
+
+def add_job_search(cursor):
+    # External-content FTS5 index over the searchable job columns, kept in
+    # sync with `jobs` by triggers.
+    columns = ['job_title', 'company_name', 'location', 'description_short', 'description_long']
+    new = ', '.join('new.' + column for column in columns)
+    old = ', '.join('old.' + column for column in columns)
+    delete = "INSERT INTO jobs_fts(jobs_fts, rowid, {0}) VALUES ('delete', old.id, {1});".format(', '.join(columns), old)
+    insert = "INSERT INTO jobs_fts(rowid, {0}) VALUES (new.id, {1});".format(', '.join(columns), new)
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5({}, content='jobs', content_rowid='id', tokenize='unicode61 remove_diacritics 2')".format(', '.join(columns)))
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS jobs_fts_insert AFTER INSERT ON jobs BEGIN {} END".format(insert))
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS jobs_fts_delete AFTER DELETE ON jobs BEGIN {} END".format(delete))
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS jobs_fts_update AFTER UPDATE OF {} ON jobs BEGIN {} {} END".format(', '.join(columns), delete, insert))
+    cursor.execute("INSERT INTO jobs_fts(jobs_fts) VALUES ('rebuild')")
+
+def add_job_filter_indexes(cursor):
+    # Single-column indexes end in the rowid, so `col = ? AND id > ?
+    # ORDER BY id` is a range seek with no sort for keyset pages.
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_jobs_job_type ON jobs (job_type)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_jobs_location ON jobs (location)")
+
+def add_row_versions(cursor):
+    # Per-row `version` and `updated_at` (unix seconds) for ETag and
+    # Last-Modified. Triggers maintain them, so every write path is covered,
+    # bulk inserts included.
+    now = "CAST(strftime('%s', 'now') AS INTEGER)"
+    for table, columns in (('jobs', JOB_COLUMNS), ('users', USER_COLUMNS)):
+        existing = {row[1] for row in cursor.execute('PRAGMA table_info({})'.format(table))}
+        if 'version' not in existing:
+            cursor.execute('ALTER TABLE {} ADD COLUMN version INTEGER NOT NULL DEFAULT 1'.format(table))
+        if 'updated_at' not in existing:
+            cursor.execute('ALTER TABLE {} ADD COLUMN updated_at INTEGER NOT NULL DEFAULT 0'.format(table))
+        cursor.execute('UPDATE {} SET updated_at = {} WHERE updated_at = 0'.format(table, now))
+        cursor.execute("CREATE TRIGGER IF NOT EXISTS {0}_touch_insert AFTER INSERT ON {0} BEGIN "
+                       "UPDATE {0} SET updated_at = {1} WHERE id = new.id; END".format(table, now))
+        cursor.execute("CREATE TRIGGER IF NOT EXISTS {0}_touch_update AFTER UPDATE OF {1} ON {0} BEGIN "
+                       "UPDATE {0} SET version = old.version + 1, updated_at = {2} WHERE id = new.id; END"
+                       .format(table, ', '.join(columns), now))
+    # (version, updated_at) of a job without reading its long description
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_jobs_id_version ON jobs (id, version, updated_at)')
+    track_versions(cursor, 'job_categories', ['added_by', 'name'])
+
+def application_delta(row, sign):
+    return ('application_count = application_count {0} 1, '
+            "applied_count = applied_count {0} ({1}.status = 'a'), "
+            "selected_count = selected_count {0} ({1}.status = 's'), "
+            "rejected_count = rejected_count {0} ({1}.status = 'r'), "
+            "filled_count = filled_count {0} ({1}.status = 'f')").format(sign, row)
+
+def add_job_counters(cursor):
+    # The counter columns stay out of JOB_COLUMNS: an application must not
+    # bump the job's version or invalidate cached jobs.
+    existing = {row[1] for row in cursor.execute('PRAGMA table_info(jobs)')}
+    for name in JOB_COUNTERS:
+        if name not in existing:
+            cursor.execute('ALTER TABLE jobs ADD COLUMN {} INTEGER NOT NULL DEFAULT 0'.format(name))
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_applied_jobs_job_status ON applied_jobs (job_id, status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_favourite_jobs_job_id ON favourite_jobs (job_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_jobs_created_by ON jobs (created_by)')
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS applied_jobs_count_insert AFTER INSERT ON applied_jobs BEGIN "
+                   "UPDATE jobs SET {} WHERE id = new.job_id; END".format(application_delta('new', '+')))
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS applied_jobs_count_delete AFTER DELETE ON applied_jobs BEGIN "
+                   "UPDATE jobs SET {} WHERE id = old.job_id; END".format(application_delta('old', '-')))
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS applied_jobs_count_update AFTER UPDATE OF status, job_id ON applied_jobs BEGIN "
+                   "UPDATE jobs SET {} WHERE id = old.job_id; UPDATE jobs SET {} WHERE id = new.job_id; END"
+                   .format(application_delta('old', '-'), application_delta('new', '+')))
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS favourite_jobs_count_insert AFTER INSERT ON favourite_jobs BEGIN "
+                   "UPDATE jobs SET favourite_count = favourite_count + 1 WHERE id = new.job_id; END")
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS favourite_jobs_count_delete AFTER DELETE ON favourite_jobs BEGIN "
+                   "UPDATE jobs SET favourite_count = favourite_count - 1 WHERE id = old.job_id; END")
+    cursor.execute('UPDATE jobs SET ' + ', '.join('{} = ({})'.format(name, count) for name, count in JOB_COUNTERS.items()))
+
+def add_user_autoincrement(cursor):
+    # A plain INTEGER PRIMARY KEY hands the id of a deleted user to the next
+    # signup, whose row version starts over at 1: the old account's ETags
+    # and tokens would then match the new one. SQLite cannot add
+    # AUTOINCREMENT in place, so the table is rebuilt; foreign keys are not
+    # enforced, so the referencing tables are left alone.
+    sql = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'users'").fetchone()[0]
+    if 'AUTOINCREMENT' in sql:
+        return
+    triggers = [row[0] for row in cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'users'")]
+    create = str(CreateTable(User).compile(dialect=sqlite.dialect())).replace('CREATE TABLE users ', 'CREATE TABLE users_new ', 1)
+    columns = ', '.join(column.name for column in User.columns)
+    cursor.execute(create)
+    cursor.execute('INSERT INTO users_new ({0}) SELECT {0} FROM users'.format(columns))
+    cursor.execute('DROP TABLE users')
+    cursor.execute('ALTER TABLE users_new RENAME TO users')
+    for trigger in triggers:
+        cursor.execute(trigger)
+
+
+MIGRATIONS = [
+    (1, create_schema),
+    (2, add_lookup_indexes),
+    (3, add_table_versions),
+    (4, add_job_search),
+    (5, add_job_filter_indexes),
+    (6, add_row_versions),
+    (7, add_job_counters),
+    (8, add_user_autoincrement),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(connection):
+    return connection.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(path=DATABASE_PATH):
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        configure(connection)
+        if current_version(connection) >= LATEST_VERSION:
+            return LATEST_VERSION
+
+        # BEGIN IMMEDIATE takes the write lock up front, so when several
+        # workers start together only one of them applies the migrations
+        # and the others see the new version once they get the lock.
+        cursor = connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            version = current_version(connection)
+            for number, migration in MIGRATIONS:
+                if number > version:
+                    migration(cursor)
+                    cursor.execute('PRAGMA user_version = {}'.format(int(number)))
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        return current_version(connection)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    print('Database at version {}'.format(migrate()))
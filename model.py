@@ -1,11 +1,10 @@
 from sqlalchemy import (
     Table, Column, Integer, Float, Boolean, String, DateTime, Text,
-    ForeignKey, Enum, TIMESTAMP, MetaData, create_engine
+    ForeignKey, Enum, TIMESTAMP, MetaData, Index
 )
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
-from base import DATABASE
 from datetime import datetime
 import enum
 
@@ -59,6 +58,9 @@ User = Table(
     Column("phone", String(32), nullable=True),
     Column("gender", Enum(Gender), default='o'),
     Column("role", Enum(Role), default='u'),
+    Column("version", Integer, nullable=False, server_default='1'),
+    Column("updated_at", Integer, nullable=False, server_default='0'),
+    sqlite_autoincrement=True,
 )
 
 JobCategory = Table(
@@ -85,6 +87,22 @@ Job = Table(
     Column("status", Enum(JobStatus), default='cr'),
     Column("description_short", String(255), nullable=True),
     Column("description_long", Text, nullable=True),
+    Column("version", Integer, nullable=False, server_default='1'),
+    Column("updated_at", Integer, nullable=False, server_default='0'),
+    Column("application_count", Integer, nullable=False, server_default='0'),
+    Column("applied_count", Integer, nullable=False, server_default='0'),
+    Column("selected_count", Integer, nullable=False, server_default='0'),
+    Column("rejected_count", Integer, nullable=False, server_default='0'),
+    Column("filled_count", Integer, nullable=False, server_default='0'),
+    Column("favourite_count", Integer, nullable=False, server_default='0'),
+    Index("ix_jobs_created_by_status", "created_by", "status"),
+    Index("ix_jobs_created_by", "created_by"),
+    Index("ix_jobs_status_category", "status", "category"),
+    Index("ix_jobs_category", "category"),
+    Index("ix_jobs_status", "status"),
+    Index("ix_jobs_job_type", "job_type"),
+    Index("ix_jobs_location", "location"),
+    Index("ix_jobs_id_version", "id", "version", "updated_at"),
 )
 
 Skill = Table(
@@ -95,6 +113,7 @@ Skill = Table(
     Column("type", Enum(SkillType), nullable=True),
     Column("level", Enum(SkillLevel), nullable=True),
     Column("job_id", Integer, ForeignKey('jobs.id'), unique=False),
+    Index("ix_skills_job_id", "job_id"),
 )
 
 AppliedJob = Table(
@@ -104,6 +123,8 @@ AppliedJob = Table(
     Column("user_id", Integer, ForeignKey('users.id'), unique=False),
     Column("job_id", Integer, ForeignKey('jobs.id'), unique=False),
     Column("status", Enum(JobStatus), default='cr'),
+    Index("ux_applied_jobs_user_job", "user_id", "job_id", unique=True),
+    Index("ix_applied_jobs_job_status", "job_id", "status"),
 )
 
 FavouriteJob = Table(
@@ -113,10 +134,17 @@ FavouriteJob = Table(
     Column("user_id", Integer, ForeignKey('users.id'), unique=False),
     Column("job_id", Integer, ForeignKey('jobs.id'), unique=False),
     Column("is_liked", Boolean),
+    Index("ux_favourite_jobs_user_job", "user_id", "job_id", unique=True),
+    Index("ix_favourite_jobs_job_id", "job_id"),
 )
 
 
+# Bumped by triggers on every committed change to the tracked tables, so
+# each worker's in-process caches can tell when another worker wrote.
+TableVersion = Table(
+    "table_versions",
+    metadata,
+    Column("name", String(64), primary_key=True),
+    Column("version", Integer, nullable=False, default=0),
+)
 
-engine = create_engine(DATABASE, connect_args={"check_same_thread": False})
-
-metadata.create_all(engine)
\ No newline at end of file
@@ -0,0 +1,38 @@
+import base64
+import binascii
+import json
+
+
+# Keyset pagination: pages are addressed by the last `id` seen instead of an
+# OFFSET, so SQLite seeks straight to the next row through the primary key.
+# The cursor is opaque to clients and also carries the filters of the first
+# request so that following pages stay consistent with it.
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(last_id, filters=None):
+    data = {'id': last_id}
+    if filters:
+        data['f'] = filters
+    raw = json.dumps(data, separators=(',', ':'), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return int(data['id']), data.get('f') or {}
+    except (binascii.Error, ValueError, KeyError, TypeError, AttributeError):
+        raise InvalidCursor(cursor)
+
+def next_cursor(rows, paginate, filters=None, key='id'):
+    # `filters` may also be a function of the last row, for pages ordered
+    # on more than the key
+    if rows and len(rows) >= paginate:
+        last = rows[-1]
+        return encode_cursor(last[key], filters(last) if callable(filters) else filters)
+    return None
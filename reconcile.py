@@ -0,0 +1,20 @@
+import asyncio
+
+import repository
+
+
+# Recomputes the per-job counters and repairs the ones that drifted. Run it
+# from one place (cron, or by hand after a restore), not from the workers:
+# every worker would otherwise repeat the same full pass.
+
+
+async def reconcile():
+    await repository.database.connect()
+    try:
+        return await repository.reconcile_job_counters()
+    finally:
+        await repository.database.disconnect()
+
+
+if __name__ == '__main__':
+    print('Reconciled counters of {} jobs'.format(asyncio.run(reconcile())))
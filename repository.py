@@ -0,0 +1,465 @@
+import asyncio
+import contextvars
+import enum
+import time
+from sqlalchemy import and_, func, select, text, Float, String
+from sqlalchemy.sql import column
+
+from base import DATABASE, DATABASE_PATH
+from batching import WriteBatcher
+from cache import TTLCache, TableCache, TableSnapshot, TableVersions
+from connections import Database, notify_listeners
+from migrations import JOB_COUNTERS
+from model import User, JobCategory, Job, FavouriteJob, AppliedJob, JobStatus
+
+
+# Every route goes through this module, so all database I/O is awaited on
+# the `databases` connection instead of blocking the event loop. Reads run
+# on a pool of WAL readers and writes queue for one writer per process,
+# see connections.py.
+database = Database(DATABASE)
+
+# Job postings are read far more often than written, so single-job reads
+# go through an in-process cache kept coherent across workers by the
+# `table_versions` counters.
+JOB_CACHE_SIZE = 10000
+JOB_CACHE_TTL = 300
+
+table_versions = TableVersions(DATABASE_PATH)
+job_cache = TableCache(table_versions, 'jobs', maxsize=JOB_CACHE_SIZE, ttl=JOB_CACHE_TTL)
+# Categories change a few times a day and are read on every page: the whole
+# table is held in memory and reloaded only when its version moves.
+categories = TableSnapshot(table_versions, 'job_categories', key='name')
+
+# Applications and favourites arrive in bursts of single-row inserts; they
+# are group-committed, at the cost of up to WRITE_BATCH_DELAY of latency.
+WRITE_BATCH_SIZE = 200
+WRITE_BATCH_DELAY = 0.005
+
+# The per-job counters are kept by triggers; reconciliation only repairs
+# drift from writes made outside them (restores, manual fixes), see
+# reconcile.py.
+COUNTER_RECONCILE_CHUNK = 1000
+
+
+async def connect():
+    await database.connect()
+    # Own contexts, hence own connections, as for the write batchers: a
+    # query run here would leave its connection to every task the caller
+    # starts afterwards.
+    await contextvars.Context().run(asyncio.ensure_future, category_snapshot())
+
+def pool_stats():
+    return database._backend.pool.stats()
+
+def is_ready():
+    return database.is_connected and database._backend.pool.ready
+
+async def disconnect():
+    await application_writes.close()
+    await favourite_writes.close()
+    await database.disconnect()
+
+
+def keyset(query, column, after_id, paginate):
+    return query.where(column > after_id).order_by(column).limit(paginate)
+
+
+async def iterate_table(table, chunk_size=1000):
+    # Streams a whole table in id order. Each chunk is read in full before
+    # any of it is handed on, so the reader connection goes back to the pool
+    # while the caller waits on a slow client.
+    after_id = 0
+    while True:
+        rows = await database.fetch_all(keyset(table.select(), table.c.id, after_id, chunk_size))
+        for row in rows:
+            yield row
+        if len(rows) < chunk_size:
+            return
+        after_id = rows[-1]['id']
+
+
+# users
+
+async def get_user(user_id):
+    query = User.select().where(User.c.id == user_id)
+    return await database.fetch_one(query)
+
+async def get_user_by_username(username):
+    query = User.select().where(User.c.username == username)
+    return await database.fetch_one(query)
+
+async def get_user_version(user_id):
+    query = select([User.c.version, User.c.updated_at]).where(User.c.id == user_id)
+    return await database.fetch_one(query)
+
+async def get_users(skip=0, paginate=20):
+    query = User.select().order_by(User.c.id).offset(skip).limit(paginate)
+    return await database.fetch_all(query)
+
+async def get_users_after(after_id, paginate=20):
+    query = keyset(User.select(), User.c.id, after_id, paginate)
+    return await database.fetch_all(query)
+
+async def create_user(**values):
+    query = User.insert().values(**values)
+    return await database.execute(query)
+
+async def update_user(user_id, **values):
+    query = User.update().where(User.c.id == user_id).values(**values)
+    return await database.execute(query)
+
+async def delete_user(user_id):
+    query = User.delete().where(User.c.id == user_id)
+    return await database.execute(query)
+
+
+# job categories
+
+async def create_category(**values):
+    query = JobCategory.insert().values(**values)
+    result = await database.execute(query)
+    table_versions.expire()
+    await category_snapshot()
+    return result
+
+async def category_snapshot():
+    version = categories.stale()
+    if version is not None:
+        rows = await database.fetch_all(JobCategory.select().order_by(JobCategory.c.id))
+        categories.replace(version, rows)
+    return categories
+
+async def get_categories(skip=0):
+    return (await category_snapshot()).rows[skip:]
+
+async def category_exists(name, recheck=True):
+    if name in await category_snapshot():
+        return True
+    if not recheck:
+        return False
+    # A category another worker has just added may not be checked for yet.
+    # The recheck is a blocking read, so callers testing many names in a
+    # row (bulk imports) turn it off after the first miss.
+    table_versions.expire()
+    return name in await category_snapshot()
+
+
+# jobs
+
+async def get_job(job_id):
+    query = Job.select().where(Job.c.id == job_id)
+    return await job_cache.get_or_load(job_id, lambda: database.fetch_one(query))
+
+async def get_job_version(job_id):
+    # (version, updated_at), from the cached row when there is one, else
+    # from the covering (id, version, updated_at) index
+    job_cache.sync()
+    row = job_cache.get(job_id)
+    if row is None:
+        query = select([Job.c.version, Job.c.updated_at]).where(Job.c.id == job_id)
+        row = await database.fetch_one(query)
+    return row
+
+def table_version(table):
+    return table_versions.version(table)
+
+# Listings leave deleted jobs out unless a status is asked for. `!= 'd'`
+# is deliberately not indexable: nearly every job is active, and this way
+# SQLite walks the primary key or the (column, rowid) index of another
+# filter in id order, so keyset pages never need a sort.
+def job_filters(category=None, job_type=None, status=None, experiance_min=None,
+                experiance_max=None, location=None):
+    clauses = [Job.c.status == status if status else Job.c.status != JobStatus.d]
+    if category is not None:
+        clauses.append(Job.c.category == category)
+    if job_type is not None:
+        clauses.append(Job.c.job_type == job_type)
+    if location is not None:
+        clauses.append(Job.c.location == location)
+    # ranges overlap when each one starts before the other one ends
+    if experiance_min is not None:
+        clauses.append(Job.c.experiance_max >= experiance_min)
+    if experiance_max is not None:
+        clauses.append(Job.c.experiance_min <= experiance_max)
+    return and_(*clauses)
+
+async def get_jobs(skip=0, paginate=20, **filters):
+    query = Job.select().where(job_filters(**filters)).order_by(Job.c.id).offset(skip).limit(paginate)
+    return await database.fetch_all(query)
+
+async def get_jobs_after(after_id, paginate=20, **filters):
+    query = keyset(Job.select().where(job_filters(**filters)), Job.c.id, after_id, paginate)
+    return await database.fetch_all(query)
+
+async def get_jobs_created_by(user_id):
+    query = Job.select().where(and_(
+        Job.c.created_by == user_id,
+        Job.c.status != JobStatus.d,
+    ))
+    return await database.fetch_all(query)
+
+async def create_job(**values):
+    query = Job.insert().values(**values)
+    result = await database.execute(query)
+    table_versions.expire()
+    job_cache.sync()
+    return result
+
+def match_expression(terms):
+    # Every term must match, as a prefix; quoting keeps FTS5 query syntax
+    # in user input from being interpreted.
+    return ' '.join('"{}"*'.format(term) for term in terms)
+
+async def search_jobs(terms, after=None, paginate=20):
+    # Weights favour the title over company, location and descriptions.
+    # Pages are keyed on (score, id) because bm25 can tie; `rank` itself is
+    # a hidden FTS5 column, hence the other alias.
+    bm25 = 'bm25(jobs_fts, 10.0, 5.0, 3.0, 2.0, 1.0)'
+    sql = '''
+        SELECT jobs.*, {bm25} AS score,
+            snippet(jobs_fts, -1, '<mark>', '</mark>', '...', 12) AS snippet
+        FROM jobs_fts JOIN jobs ON jobs.id = jobs_fts.rowid
+        WHERE jobs_fts MATCH :match AND jobs.status != 'd'
+    '''.format(bm25=bm25)
+    values = {'match': match_expression(terms), 'paginate': paginate}
+    if after:
+        # each bind name only once: databases binds parameters by name order
+        sql += ' AND ({0} > :after_score OR ({0} = :tied_score AND jobs.id > :after_id))'.format(bm25)
+        values.update(after_score=after[0], tied_score=after[0], after_id=after[1])
+    sql += ' ORDER BY score, jobs.id LIMIT :paginate'
+    query = text(sql).bindparams(**values).columns(*Job.c, column('score', Float), column('snippet', String))
+    return await database.fetch_all(query)
+
+def _column_value(value):
+    return value.name if isinstance(value, enum.Enum) else value
+
+async def get_job_dashboard(user_id, after_id=0, paginate=20):
+    # counters are columns of the job row, so a page costs the same however
+    # many applications the jobs have
+    query = select([
+        Job.c.id,
+        Job.c.job_title,
+        Job.c.company_name,
+        Job.c.location,
+        Job.c.status,
+        Job.c.job_count,
+        *(Job.c[name] for name in JOB_COUNTERS),
+    ]).where(and_(
+        Job.c.created_by == user_id,
+        Job.c.status != JobStatus.d,
+        Job.c.id > after_id,
+    )).order_by(Job.c.id).limit(paginate)
+    return await database.fetch_all(query)
+
+async def reconcile_job_counters(chunk_size=COUNTER_RECONCILE_CHUNK):
+    # Chunks of job ids, each checked and repaired in one write transaction
+    # so no application can land between the count and the fix; only rows
+    # that drifted are written. Returns how many were.
+    actual = ', '.join('({}) AS {}'.format(count, name) for name, count in JOB_COUNTERS.items())
+    stored = ', '.join('{0} AS stored_{0}'.format(name) for name in JOB_COUNTERS)
+    drifted = ' OR '.join('{0} != stored_{0}'.format(name) for name in JOB_COUNTERS)
+    check = text(
+        'SELECT id, {} FROM (SELECT id, {}, {} FROM jobs WHERE id > :low AND id <= :high) WHERE {}'
+        .format(', '.join(JOB_COUNTERS), actual, stored, drifted)
+    )
+    repair = 'UPDATE jobs SET {} WHERE id = :id'.format(', '.join('{0} = :{0}'.format(name) for name in JOB_COUNTERS))
+
+    last_id = await database.fetch_val(select([func.max(Job.c.id)])) or 0
+    repaired = 0
+    for low in range(0, last_id, chunk_size):
+        async with database.transaction():
+            rows = await database.fetch_all(check.bindparams(low=low, high=low + chunk_size))
+            if rows:
+                await database.execute_many(repair, [dict(row) for row in rows])
+        repaired += len(rows)
+    return repaired
+
+async def create_jobs(rows):
+    # One transaction and one executemany on the raw connection per batch:
+    # a single commit for the whole batch instead of one per job.
+    compiled = Job.insert().compile(dialect=database._backend._dialect, column_keys=list(rows[0]))
+    params = [tuple(_column_value(row[name]) for name in compiled.positiontup) for row in rows]
+    async with database.connection() as connection:
+        async with connection.transaction():
+            # timed here, as the pool times its own statements; the first
+            # row stands for the batch in the slow query log
+            started = time.perf_counter()
+            try:
+                await connection.raw_connection.executemany(compiled.string, params)
+            finally:
+                notify_listeners(compiled.string, params[0], time.perf_counter() - started)
+    table_versions.expire()
+    job_cache.sync()
+
+async def update_job(job_id, **values):
+    query = Job.update().where(Job.c.id == job_id).values(**values)
+    result = await database.execute(query)
+    table_versions.expire()
+    job_cache.pop(job_id)
+    return result
+
+
+# applied jobs
+
+async def insert_application(values):
+    # The unique (user_id, job_id) index enforces one application per job,
+    # an ignored insert returns 0.
+    query = AppliedJob.insert().prefix_with('OR IGNORE').values(**values)
+    return await database.execute(query)
+
+application_writes = WriteBatcher(database, insert_application, WRITE_BATCH_SIZE, WRITE_BATCH_DELAY)
+
+async def create_application(**values):
+    return await application_writes.submit(values)
+
+async def iterate_applied_jobs(user_id, after_id=0, paginate=20):
+    # One applied_jobs JOIN jobs page, keyed on the application id.
+    query = select([
+        AppliedJob.c.id.label('apply_id'),
+        AppliedJob.c.status.label('my_status'),
+        Job.c.id,
+        Job.c.company_name,
+        Job.c.job_title,
+        Job.c.job_type,
+        Job.c.experiance_min,
+        Job.c.experiance_max,
+        Job.c.job_count,
+        Job.c.location,
+        Job.c.status,
+    ]).select_from(
+        AppliedJob.join(Job, Job.c.id == AppliedJob.c.job_id)
+    ).where(and_(
+        AppliedJob.c.user_id == user_id,
+        AppliedJob.c.id > after_id,
+    )).order_by(AppliedJob.c.id).limit(paginate)
+    async for row in database.iterate(query):
+        yield row
+
+async def get_job_applicants(job_id, status=None, after_id=0, paginate=20):
+    # keyed on the application id; with a status filter the page is a range
+    # of the (job_id, status) index, which ends in the id
+    clauses = [AppliedJob.c.job_id == job_id, AppliedJob.c.id > after_id]
+    if status is not None:
+        clauses.append(AppliedJob.c.status == status)
+    query = select([
+        AppliedJob.c.id.label('apply_id'),
+        AppliedJob.c.status,
+        User.c.id,
+        User.c.first_name,
+        User.c.last_name,
+        User.c.username,
+        User.c.phone,
+        User.c.gender,
+    ]).select_from(
+        AppliedJob.join(User, User.c.id == AppliedJob.c.user_id)
+    ).where(and_(*clauses)).order_by(AppliedJob.c.id).limit(paginate)
+    return await database.fetch_all(query)
+
+async def set_application_status(job_id, apply_ids, status):
+    # One UPDATE for the whole batch, restricted to the job's applications.
+    # The ids found are read in the same transaction so the caller can report
+    # the rest; the count triggers move the job's counters along.
+    async with database.transaction():
+        query = select([AppliedJob.c.id]).where(and_(
+            AppliedJob.c.job_id == job_id,
+            AppliedJob.c.id.in_(apply_ids),
+        ))
+        found = [row.id for row in await database.fetch_all(query)]
+        if found:
+            query = AppliedJob.update().where(and_(
+                AppliedJob.c.job_id == job_id,
+                AppliedJob.c.id.in_(found),
+                AppliedJob.c.status != status,
+            )).values(status=status)
+            await database.execute(query)
+    return found
+
+async def count_applied_jobs(user_id):
+    # read from the (user_id, job_id) index alone
+    query = select([func.count()]).where(AppliedJob.c.user_id == user_id)
+    return await database.fetch_val(query)
+
+async def get_applied_job_details(user_id, apply_ids):
+    # Application status, job and recruiter in a single joined statement;
+    # the recruiter is outer-joined since the job may outlive the account.
+    recruiter = User.alias('recruiter')
+    query = select([
+        AppliedJob.c.id.label('apply_id'),
+        AppliedJob.c.status.label('my_status'),
+        Job.c.id,
+        Job.c.company_name,
+        Job.c.job_title,
+        Job.c.job_type,
+        Job.c.experiance_min,
+        Job.c.experiance_max,
+        Job.c.job_count,
+        Job.c.location,
+        Job.c.status,
+        recruiter.c.id.label('recruiter_id'),
+        recruiter.c.first_name.label('recruiter_first_name'),
+        recruiter.c.last_name.label('recruiter_last_name'),
+        recruiter.c.username.label('recruiter_username'),
+        recruiter.c.phone.label('recruiter_phone'),
+        recruiter.c.gender.label('recruiter_gender'),
+    ]).select_from(
+        AppliedJob.join(Job, Job.c.id == AppliedJob.c.job_id)
+        .outerjoin(recruiter, recruiter.c.id == Job.c.created_by)
+    ).where(and_(
+        AppliedJob.c.user_id == user_id,
+        AppliedJob.c.id.in_(apply_ids),
+    )).order_by(AppliedJob.c.id)
+    return await database.fetch_all(query)
+
+
+# favourite jobs
+
+FAVOURITE_COUNT_CACHE_SIZE = 10000
+FAVOURITE_COUNT_CACHE_TTL = 60
+
+# Per-user counts, evicted by this worker's own writes; another worker's
+# writes show up once the entry expires.
+favourite_counts = TTLCache(maxsize=FAVOURITE_COUNT_CACHE_SIZE, ttl=FAVOURITE_COUNT_CACHE_TTL)
+
+
+async def get_user_favourites(user_id, after_job_id=0, paginate=20, include_jobs=False):
+    # Keyed on job_id so that without the job join the page is read from
+    # the unique (user_id, job_id) index alone, already in order.
+    columns = [FavouriteJob.c.id, FavouriteJob.c.user_id, FavouriteJob.c.job_id]
+    source = FavouriteJob
+    if include_jobs:
+        columns += [Job.c.job_title, Job.c.company_name, Job.c.location, Job.c.job_type, Job.c.status]
+        source = FavouriteJob.outerjoin(Job, Job.c.id == FavouriteJob.c.job_id)
+    query = select(columns).select_from(source).where(and_(
+        FavouriteJob.c.user_id == user_id,
+        FavouriteJob.c.job_id > after_job_id,
+    )).order_by(FavouriteJob.c.job_id).limit(paginate)
+    return await database.fetch_all(query)
+
+async def count_user_favourites(user_id):
+    count = favourite_counts.get(user_id)
+    if count is None:
+        query = select([func.count()]).where(FavouriteJob.c.user_id == user_id)
+        count = await database.fetch_val(query)
+        favourite_counts.set(user_id, count)
+    return count
+
+async def insert_favourite(values):
+    query = FavouriteJob.insert().prefix_with('OR IGNORE').values(**values)
+    return await database.execute(query)
+
+favourite_writes = WriteBatcher(database, insert_favourite, WRITE_BATCH_SIZE, WRITE_BATCH_DELAY)
+
+async def create_favourite(**values):
+    result = await favourite_writes.submit(values)
+    favourite_counts.pop(values['user_id'])
+    return result
+
+async def delete_favourite(favourite_id, user_id):
+    query = FavouriteJob.delete().where(and_(
+        FavouriteJob.c.id == favourite_id,
+        FavouriteJob.c.user_id == user_id,
+    ))
+    result = await database.execute(query)
+    favourite_counts.pop(user_id)
+    return result
@@ -0,0 +1,118 @@
+import asyncio
+import enum
+import json
+from email.utils import formatdate, parsedate_to_datetime
+
+from starlette.responses import JSONResponse, Response, StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+
+def row_to_dict(row, fields):
+    return {field: row[field] for field in fields}
+
+def rows_to_dicts(rows, fields):
+    return [row_to_dict(row, fields) for row in rows]
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded in a single pass, with orjson when installed.
+
+    Routes that return it skip `response_model` validation and the
+    jsonable_encoder walk, so content must already be plain data: build it
+    with `rows_to_dicts`. Enums (JobType, JobStatus, Role, Gender) are
+    written as their values.
+    """
+
+    def render(self, content):
+        if orjson is not None:
+            return orjson.dumps(content, default=_default)
+        return json.dumps(
+            content,
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(',', ':'),
+            default=_default,
+        ).encode('utf-8')
+
+
+class DisconnectAwareStreamingResponse(StreamingResponse):
+    """StreamingResponse that stops streaming when the client goes away.
+
+    Starlette 0.13 passes bare coroutines to `asyncio.wait`, which Python
+    3.11 rejects, so the stock response fails every request; here the
+    stream and the disconnect listener run as tasks.
+    """
+
+    async def __call__(self, scope, receive, send):
+        tasks = [
+            asyncio.ensure_future(self.stream_response(send)),
+            asyncio.ensure_future(self.listen_for_disconnect(receive)),
+        ]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in done:
+            task.result()
+        if self.background is not None:
+            await self.background()
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body may keep reading the request body.
+
+    The stock response listens for a client disconnect on `receive` while
+    streaming, which would swallow request body chunks still in flight.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+# conditional requests
+
+def entity_tag(*parts):
+    return '"{}"'.format('-'.join(str(part) for part in parts))
+
+def validators(etag, last_modified=None):
+    headers = {'ETag': etag}
+    if last_modified:
+        headers['Last-Modified'] = formatdate(last_modified, usegmt=True)
+    return headers
+
+def is_conditional(headers):
+    return 'if-none-match' in headers or 'if-modified-since' in headers
+
+def is_fresh(headers, etag, last_modified=None):
+    """Whether the client's copy still matches, per RFC 7232.
+
+    If-None-Match wins when both are sent; tags compare weakly.
+    """
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = {tag.strip() for tag in if_none_match.split(',')}
+        return '*' in tags or bool({etag, 'W/' + etag} & tags)
+    if_modified_since = headers.get('if-modified-since')
+    if if_modified_since and last_modified:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class NotModifiedResponse(Response):
+    def __init__(self, etag, last_modified=None):
+        super().__init__(status_code=304, headers=validators(etag, last_modified))
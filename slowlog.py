@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+
+from base import DATABASE_PATH
+from connections import configure
+from metrics import current_route
+
+
+# Statements slower than the threshold are logged, a sampled fraction of
+# them, as one JSON object per line on the `slow_query` logger. The request
+# path only does a comparison and a queue put; the EXPLAIN QUERY PLAN and
+# the logging happen on a background thread with its own connection.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+SLOW_QUERY_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_SAMPLE_RATE', 1.0))
+SLOW_QUERY_QUEUE_SIZE = 1000
+MAX_PARAMETER_LENGTH = 100
+
+EXPLAINABLE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH|REPLACE)\b', re.IGNORECASE)
+# `SCAN jobs` reads the whole table; an index scan says `USING ... INDEX`
+# and an FTS5 lookup `VIRTUAL TABLE INDEX`
+FULL_SCAN = re.compile(r'^SCAN (?!.*\b(USING|VIRTUAL TABLE)\b)')
+PASSWORD_HASH = re.compile(r'^(pbkdf2_sha256|scrypt)\$|^[0-9a-f]{64}$')
+
+logger = logging.getLogger('slow_query')
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(levelname)s slow_query %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class SlowQueryLog:
+    def __init__(self, path=DATABASE_PATH, threshold_ms=SLOW_QUERY_THRESHOLD_MS, sample_rate=SLOW_QUERY_SAMPLE_RATE):
+        self.path = path
+        self.threshold = threshold_ms / 1000
+        self.sample_rate = sample_rate
+        self._queue = queue.Queue(maxsize=SLOW_QUERY_QUEUE_SIZE)
+        self._thread = None
+        self._pid = None
+        self.logged = 0
+        self.dropped = 0
+
+    def record_query(self, statement, parameters, seconds):
+        if seconds < self.threshold or random.random() >= self.sample_rate:
+            return
+        self._ensure_thread()
+        item = (time.time(), current_route(), statement, parameters, seconds)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_thread(self):
+        # started on first use, in the worker itself: a thread does not
+        # survive a fork, so one started before it would be gone
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='slow-query-log', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        connection = sqlite3.connect(self.path, isolation_level=None)
+        configure(connection)
+        while True:
+            logged_at, route, statement, parameters, seconds = self._queue.get()
+            try:
+                self._log(connection, logged_at, route, statement, parameters, seconds)
+            except Exception:
+                logger.exception('slow query log failed')
+
+    def _log(self, connection, logged_at, route, statement, parameters, seconds):
+        plan = explain(connection, statement, parameters)
+        full_scans = [detail for detail in plan if FULL_SCAN.match(detail)]
+        entry = {
+            'at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(logged_at)),
+            'duration_ms': round(seconds * 1000, 3),
+            'route': route,
+            'statement': ' '.join(statement.split()),
+            'parameters': safe_parameters(parameters),
+            'plan': plan,
+            'full_scans': full_scans,
+        }
+        self.logged += 1
+        (logger.warning if full_scans else logger.info)(json.dumps(entry, default=str))
+
+    def stats(self):
+        return {'logged': self.logged, 'dropped': self.dropped, 'queued': self._queue.qsize()}
+
+
+def explain(connection, statement, parameters):
+    if not EXPLAINABLE.match(statement):
+        return []
+    try:
+        rows = connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ()).fetchall()
+    except sqlite3.Error as error:
+        return ['EXPLAIN FAILED: {}'.format(error)]
+    return [row[3] for row in rows]
+
+def _safe_value(value):
+    if isinstance(value, str):
+        if PASSWORD_HASH.match(value):
+            return '<redacted>'
+        if len(value) > MAX_PARAMETER_LENGTH:
+            return value[:MAX_PARAMETER_LENGTH] + '...'
+    return value
+
+def safe_parameters(parameters):
+    if isinstance(parameters, dict):
+        return {name: _safe_value(value) for name, value in parameters.items()}
+    return [_safe_value(value) for value in parameters or ()]
+
+
+slow_queries = SlowQueryLog()
@@ -1 +1,6 @@
-gunicorn -w 4 -k uvicorn.workers.UvicornWorker main:app
\ No newline at end of file
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:-4}
+# Shared by the workers so /metrics covers all of them; files left by a
+# previous run belong to dead processes and would be counted again.
+export METRICS_DIR=${METRICS_DIR:-${TMPDIR:-/tmp}/fastapi-with-vue-metrics}
+mkdir -p "$METRICS_DIR" && rm -f "$METRICS_DIR"/*.json "$METRICS_DIR"/*.json.tmp
+python migrations.py && exec gunicorn -w $WEB_CONCURRENCY -k uvicorn.workers.UvicornWorker --preload main:app
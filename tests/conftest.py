@@ -0,0 +1,44 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# base.py reads these at import, so they are set before any app module is
+# imported: the app under test gets a database of its own and no rate limits.
+os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'test.db')
+for name in ('RATE_LIMIT_AUTH', 'RATE_LIMIT_USERS', 'RATE_LIMIT_JOBS'):
+    os.environ[name] = '0/1'
+
+
+@pytest.fixture(scope='session')
+def client():
+    from starlette.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture(scope='session')
+def create_user(client):
+    from helpers import verify_token
+
+    def create_user(username, **values):
+        user = dict({'password': 'secret1', 'first_name': username, 'role': 'user', 'gender': 'other'}, username=username, **values)
+        assert client.post('/users/', json=user).status_code == 200
+        token = client.post('/auth/login', json={'username': username, 'password': user['password']}).json()['token']
+        return verify_token(token).user_id, token
+    return create_user
+
+
+@pytest.fixture
+def run_async():
+    # A loop of its own that is never set as the current one: asyncio.run
+    # would leave none behind for the session's TestClient.
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
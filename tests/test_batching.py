@@ -0,0 +1,38 @@
+import asyncio
+import sqlite3
+
+from sqlalchemy import Column, Integer, MetaData, String, Table
+from sqlalchemy.schema import CreateTable
+
+from batching import WriteBatcher
+from connections import Database
+
+
+# the smallest table with a unique column and a rowid
+items = Table('items', MetaData(), Column('id', Integer, primary_key=True), Column('name', String, unique=True))
+
+
+def test_batch_commits_once_and_fails_only_the_bad_write(tmp_path, run_async):
+    database = Database('sqlite:///' + str(tmp_path / 'batch.db'))
+
+    async def insert(name):
+        return await database.execute(items.insert().values(name=name))
+
+    async def main():
+        await database.connect()
+        try:
+            await database.execute(str(CreateTable(items)))
+            batcher = WriteBatcher(database, insert, max_size=10, max_delay=0.01)
+            results = await asyncio.gather(*[batcher.submit(name) for name in ['a', 'b', 'a', 'c']], return_exceptions=True)
+            rows = await database.fetch_all('SELECT name FROM items ORDER BY id')
+            await batcher.close()
+            return batcher, results, [row['name'] for row in rows]
+        finally:
+            await database.disconnect()
+
+    batcher, results, names = run_async(main())
+    assert batcher.batches == 1
+    # each caller gets the id of its own row
+    assert results[:2] == [1, 2] and results[3] == 3
+    assert isinstance(results[2], sqlite3.IntegrityError)
+    assert names == ['a', 'b', 'c']
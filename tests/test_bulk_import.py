@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+import connections
+import repository
+from connections import WriteQueueFull
+
+
+JOB = {
+    'category': 'bulk', 'company_name': 'Acme', 'job_title': 'Importer', 'job_type': 'full time',
+    'experiance_min': 1, 'experiance_max': 3, 'job_count': 1, 'location': 'Chennai',
+    'description_short': 'short', 'description_long': 'long',
+}
+
+
+@pytest.fixture(scope='module')
+def bulk_import(client, create_user):
+    _, recruiter = create_user('bulk-recruiter', role='recruiter')
+    client.post('/jobs/category', json={'name': 'bulk'}, headers={'token': recruiter})
+
+    def bulk_import(jobs):
+        body = ''.join(json.dumps(job) + '\n' for job in jobs)
+        response = client.post('/jobs/bulk', data=body, headers={'token': recruiter})
+        assert response.status_code == 200
+        return [json.loads(line) for line in response.text.splitlines()]
+    return bulk_import
+
+
+def test_unknown_categories_are_rechecked_once(bulk_import, monkeypatch):
+    expired = []
+    expire = repository.table_versions.expire
+    monkeypatch.setattr(repository.table_versions, 'expire', lambda: expired.append(1) or expire())
+
+    lines = bulk_import([dict(JOB, category=name) for name in ['bulkk', 'blk'] * 50])
+    assert [line['status'] for line in lines[:-1]] == [406] * 100
+    assert lines[-1]['failed'] == 100
+    assert len(expired) == 1
+
+
+def test_busy_writer_fails_the_batch_and_still_summarizes(bulk_import, monkeypatch):
+    async def busy(*args, **kwargs):
+        raise WriteQueueFull()
+    monkeypatch.setattr(repository, 'create_jobs', busy)
+    monkeypatch.setattr(repository, 'create_job', busy)
+
+    lines = bulk_import([JOB] * 3)
+    assert [line['status'] for line in lines[:-1]] == [503] * 3
+    assert lines[-1] == {'detail': 'BULK IMPORT FINISHED', 'created': 0, 'failed': 3, 'status': 200}
+
+
+def test_batch_insert_is_timed(bulk_import, monkeypatch):
+    statements = []
+    monkeypatch.setattr(connections, 'QUERY_LISTENERS', connections.QUERY_LISTENERS + [
+        lambda statement, parameters, seconds: statements.append(statement),
+    ])
+
+    lines = bulk_import([JOB] * 3)
+    assert lines[-1]['created'] == 3
+    assert any(statement.startswith('INSERT INTO jobs') for statement in statements)
@@ -0,0 +1,108 @@
+import asyncio
+import contextvars
+import sqlite3
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table
+from sqlalchemy.schema import CreateTable
+
+import connections
+from connections import Database, WriteQueueFull
+
+
+# The pool is a custom `databases` backend built on private internals of
+# databases 0.3; these pin the behaviour the rest of the app relies on.
+
+# the smallest table with a unique column and a rowid
+items = Table('items', MetaData(), Column('id', Integer, primary_key=True), Column('name', String, unique=True))
+
+
+def spawn(coroutine):
+    # an empty context, hence a databases connection of its own, as for
+    # concurrent requests
+    return contextvars.Context().run(asyncio.ensure_future, coroutine)
+
+
+@pytest.fixture
+def run(tmp_path, run_async):
+    database = Database('sqlite:///' + str(tmp_path / 'pool.db'))
+
+    def run(test):
+        async def main():
+            await database.connect()
+            try:
+                await spawn(database.execute(str(CreateTable(items))))
+                await test(database)
+            finally:
+                await database.disconnect()
+        run_async(main())
+    return run
+
+
+def test_reads_do_not_wait_for_the_writer(run):
+    async def test(database):
+        held, release = asyncio.Event(), asyncio.Event()
+
+        async def write():
+            async with database.transaction():
+                await database.execute(items.insert().values(name='a'))
+                held.set()
+                await release.wait()
+
+        writer = spawn(write())
+        await held.wait()
+        # a reader sees the last commit, not the open transaction
+        assert await asyncio.wait_for(spawn(database.fetch_val('SELECT count(*) FROM items')), 1) == 0
+        release.set()
+        await writer
+        assert await spawn(database.fetch_val('SELECT count(*) FROM items')) == 1
+    run(test)
+
+
+def test_nested_transaction_rolls_back_alone(run):
+    async def test(database):
+        async def write():
+            async with database.transaction():
+                await database.execute(items.insert().values(name='a'))
+                with pytest.raises(sqlite3.IntegrityError):
+                    async with database.transaction():
+                        await database.execute(items.insert().values(name='b'))
+                        await database.execute(items.insert().values(name='a'))
+                await database.execute(items.insert().values(name='c'))
+
+        await spawn(write())
+        rows = await spawn(database.fetch_all('SELECT name FROM items ORDER BY name'))
+        assert [row['name'] for row in rows] == ['a', 'c']
+    run(test)
+
+
+def test_ignored_insert_returns_zero(run):
+    async def test(database):
+        assert await spawn(database.execute(items.insert().values(name='a'))) == 1
+        insert = items.insert().prefix_with('OR IGNORE').values(name='a')
+        # the writer's lastrowid would still say 1
+        assert await spawn(database.execute(insert)) == 0
+    run(test)
+
+
+def test_write_queue_is_bounded(run, monkeypatch):
+    monkeypatch.setattr(connections, 'MAX_PENDING_WRITES', 2)
+
+    async def test(database):
+        held, release = asyncio.Event(), asyncio.Event()
+
+        async def hold():
+            async with database.transaction():
+                held.set()
+                await release.wait()
+
+        holder = spawn(hold())
+        await held.wait()
+        waiting = [spawn(database.execute(items.insert().values(name=name))) for name in 'ab']
+        await asyncio.sleep(0)
+        with pytest.raises(WriteQueueFull):
+            await spawn(database.execute(items.insert().values(name='c')))
+        release.set()
+        await holder
+        assert await asyncio.gather(*waiting) == [1, 2]
+    run(test)
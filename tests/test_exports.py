@@ -0,0 +1,46 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def export(client, create_user):
+    _, admin = create_user('export-admin', role='admin')
+    _, recruiter = create_user('export-recruiter', role='recruiter')
+    client.post('/jobs/category', json={'name': 'export'}, headers={'token': recruiter})
+    job = {
+        'category': 'export', 'company_name': 'Acme', 'job_title': 'Exporter', 'job_type': 'full time',
+        'experiance_min': 1, 'experiance_max': 3, 'job_count': 1, 'location': 'Chennai',
+        'description_short': 'short', 'description_long': 'long',
+    }
+    assert client.post('/jobs/', json=job, headers={'token': recruiter}).status_code == 200
+
+    def export(table, **params):
+        response = client.get('/export/{}'.format(table), params=params, headers={'token': admin}, stream=True)
+        assert response.status_code == 200
+        return response
+    return export
+
+
+def test_ndjson_export(export):
+    response = export('jobs')
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert any(row['job_title'] == 'Exporter' and row['job_type'] == 'full time' for row in rows)
+
+
+def test_csv_export(export):
+    response = export('jobs', format='csv')
+    assert response.headers['content-type'].startswith('text/csv')
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert any(row['job_title'] == 'Exporter' for row in rows)
+
+
+def test_gzip_export(export):
+    response = export('jobs', format='csv', gzip='true')
+    assert response.headers['content-encoding'] == 'gzip'
+    body = gzip.decompress(response.raw.read(decode_content=False)).decode()
+    assert any(row['job_title'] == 'Exporter' for row in csv.DictReader(io.StringIO(body)))
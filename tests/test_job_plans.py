@@ -0,0 +1,56 @@
+import itertools
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations
+import repository
+from model import Job, JobStatus, JobType
+
+
+# Every keyset page of the job listing, whatever the filters, has to be an
+# index or primary key seek that already comes out in id order.
+FILTERS = {
+    'category': 'eng',
+    'job_type': JobType.ft,
+    'status': JobStatus.cr,
+    'experiance_min': 2,
+    'experiance_max': 5,
+    'location': 'Chennai',
+}
+COMBINATIONS = [
+    dict((name, FILTERS[name]) for name in names)
+    for size in range(len(FILTERS) + 1)
+    for names in itertools.combinations(FILTERS, size)
+]
+
+
+@pytest.fixture(scope='module')
+def connection(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('plans') / 'plans.db')
+    migrations.migrate(path)
+    connection = sqlite3.connect(path)
+    yield connection
+    connection.close()
+
+
+def plan(connection, query):
+    compiled = query.compile(dialect=repository.database._backend._dialect)
+    parameters = [compiled.params[name] for name in compiled.positiontup]
+    parameters = [value.name if isinstance(value, (JobType, JobStatus)) else value for value in parameters]
+    return [row[3] for row in connection.execute('EXPLAIN QUERY PLAN ' + compiled.string, parameters)]
+
+
+@pytest.mark.parametrize('filters', COMBINATIONS, ids=lambda filters: '+'.join(filters) or 'none')
+def test_job_page_is_an_ordered_seek(connection, filters):
+    query = repository.keyset(Job.select().where(repository.job_filters(**filters)), Job.c.id, 100, 20)
+    details = plan(connection, query)
+    assert any(detail.startswith('SEARCH jobs') for detail in details), details
+    assert not any('TEMP B-TREE' in detail for detail in details), details
+    # an equality filter is looked up in its (column, rowid) index
+    if set(filters) & {'category', 'job_type', 'status', 'location'}:
+        assert any('USING INDEX' in detail for detail in details), details
@@ -0,0 +1,27 @@
+def test_a_new_user_never_matches_a_deleted_users_validators(client, create_user):
+    user_id, token = create_user('bob')
+    response = client.get('/users/{}'.format(user_id))
+    etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+    assert client.delete('/users/{}'.format(user_id), headers={'token': token}).status_code == 200
+
+    new_id, _ = create_user('mallory')
+    assert new_id != user_id
+    response = client.get('/users/{}'.format(user_id), headers={'If-None-Match': etag})
+    assert response.status_code == 404
+    response = client.get('/users/{}'.format(user_id), headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 404
+    response = client.get('/users/{}'.format(new_id), headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json()['username'] == 'mallory'
+
+
+def test_user_etag_changes_on_update(client, create_user):
+    user_id, token = create_user('carol')
+    etag = client.get('/users/{}'.format(user_id)).headers['ETag']
+    assert client.get('/users/{}'.format(user_id), headers={'If-None-Match': etag}).status_code == 304
+
+    user = {'username': 'carol', 'password': 'secret1', 'first_name': 'Caroline'}
+    assert client.put('/users/{}'.format(user_id), json=user, headers={'token': token}).status_code == 200
+    response = client.get('/users/{}'.format(user_id), headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
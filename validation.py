@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 from datetime import date
+from typing import List
 
 from model import Role, Gender, JobType, JobStatus
 
@@ -44,4 +45,19 @@ class FavouriteJobValidator(BaseModel):
 
 class AppliedJobValidator(BaseModel):
     job_id: int = Field(None, title='Company Name')
-    status: JobStatus = Field(None, title='Status of the Job')
\ No newline at end of file
+    status: JobStatus = Field(None, title='Status of the Job')
+
+
+# Statuses a recruiter can move applicants to
+APPLICATION_TRANSITIONS = (JobStatus.a, JobStatus.s, JobStatus.r, JobStatus.f)
+MAX_STATUS_BATCH_SIZE = 1000
+
+class ApplicationStatusValidator(BaseModel):
+    apply_ids: List[int] = Field(..., title='Application IDs', min_items=1, max_items=MAX_STATUS_BATCH_SIZE)
+    status: JobStatus = Field(..., title='New status of the applications')
+
+    @validator('status')
+    def status_is_transition(cls, value):
+        if value not in APPLICATION_TRANSITIONS:
+            raise ValueError('must be one of: {}'.format(', '.join(status.value for status in APPLICATION_TRANSITIONS)))
+        return value